@@ -0,0 +1,221 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+from aiogram import Bot
+from aiogram.types import InputMediaPhoto
+
+from roles import role_cache
+
+logger = logging.getLogger(__name__)
+
+# Окно накопления отчетов (0 — дайджест выключен, все уходит сразу)
+ADMIN_DIGEST_INTERVAL = float(os.getenv("ADMIN_DIGEST_INTERVAL", "30"))
+# Пока за окно приходит не больше стольких отчетов, они отправляются сразу
+ADMIN_DIGEST_THRESHOLD = int(os.getenv("ADMIN_DIGEST_THRESHOLD", "3"))
+
+MEDIA_GROUP_SIZE = 10
+CAPTION_LIMIT = 1024
+
+
+class QuestReport:
+    __slots__ = ('user_id', 'username', 'task_number', 'city', 'answer', 'photo_id', 'event', 'duplicate_photo')
+
+    def __init__(
+        self,
+        user_id: int,
+        username: str | None,
+        task_number: int | None = None,
+        city: str | None = None,
+        answer: str | None = None,
+        photo_id: str | None = None,
+        event: str | None = None,
+        duplicate_photo: bool = False
+    ):
+        self.user_id = user_id
+        self.username = username
+        self.task_number = task_number
+        self.city = city
+        self.answer = answer
+        self.photo_id = photo_id
+        # Произвольное событие вместо ответа, например завершение квеста
+        self.event = event
+        # Фото уже присылали раньше: оно не пересылается, остается только ответ
+        self.duplicate_photo = duplicate_photo
+
+
+class AdminDigest:
+    """Отчеты квеста для админов: по одному при малой нагрузке, дайджестом — при большой.
+
+    Если за окно `interval` приходит больше `threshold` отчетов, они копятся и
+    раз в окно уходят альбомами (до 10 фото) с общей подписью на пользователя.
+    """
+
+    def __init__(self, interval: float, threshold: int):
+        self.interval = interval
+        self.threshold = threshold
+        self._bot: Bot | None = None
+        self._pending: list[QuestReport] = []
+        self._recent: deque[float] = deque()
+        self._task: asyncio.Task | None = None
+        # Отчеты, переданные через submit() и еще не обработанные
+        self._sending: set[asyncio.Task] = set()
+        self.sent_immediately = 0
+        self.digested = 0
+        self.messages = 0
+
+    async def add(self, bot: Bot, report: QuestReport):
+        self._bot = self._bot or bot
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > self.interval:
+            self._recent.popleft()
+        self._recent.append(now)
+
+        if self._task is None or (not self._pending and len(self._recent) <= self.threshold):
+            self.sent_immediately += 1
+            await self._send_single(bot, report)
+        else:
+            self._pending.append(report)
+
+    def submit(self, bot: Bot, report: QuestReport):
+        """Передает отчет в фон: вызывающий не ждет ни список админов, ни отправку"""
+        task = asyncio.create_task(self._add_safely(bot, report))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _add_safely(self, bot: Bot, report: QuestReport):
+        try:
+            await self.add(bot, report)
+        except Exception as e:
+            logger.error(f"Ошибка отправки отчета админам: {e}")
+
+    @staticmethod
+    def _header(report: QuestReport) -> str:
+        return (
+            f"▪️ Юзер: @{report.username or 'Аноним'} ({report.user_id})\n"
+            f"▪️ Город: {report.city or 'не указан'}\n"
+        )
+
+    @staticmethod
+    def _line(report: QuestReport) -> str:
+        if report.event:
+            return report.event
+        line = f"▪️ Задание: #{report.task_number}"
+        if report.answer:
+            line += f" — {report.answer}"
+        if report.duplicate_photo:
+            line += " ♻️"
+        return line
+
+    async def _send_single(self, bot: Bot, report: QuestReport):
+        if report.event:
+            text = report.event
+        else:
+            text = (
+                "📊 *Новый отчет по заданию*\n"
+                f"▪️ Юзер: @{report.username or 'Аноним'} ([{report.user_id}](tg://user?id={report.user_id}))\n"
+                f"▪️ Город: {report.city or 'не указан'}\n"
+                f"▪️ Задание: #{report.task_number}\n"
+            )
+            if report.answer:
+                text += f"📝 Ответ: {report.answer}\n"
+            if report.duplicate_photo:
+                text += "♻️ Фото повторное, не пересылается\n"
+        parse_mode = None if report.event else "Markdown"
+
+        for admin_id in await role_cache.admin_ids():
+            try:
+                if report.photo_id:
+                    await bot.send_photo(
+                        chat_id=admin_id,
+                        photo=report.photo_id,
+                        caption=text,
+                        parse_mode=parse_mode
+                    )
+                else:
+                    await bot.send_message(chat_id=admin_id, text=text, parse_mode=parse_mode)
+                self.messages += 1
+            except Exception as e:
+                logger.error(f"Ошибка отправки админу {admin_id}: {str(e)}")
+
+    def _build_digest(self, reports: list[QuestReport]) -> list[tuple[str, list[str]]]:
+        """Группирует отчеты по пользователю: (подпись, file_id фото до 10 штук)"""
+        by_user: dict[int, list[QuestReport]] = {}
+        for report in reports:
+            by_user.setdefault(report.user_id, []).append(report)
+
+        parts = []
+        for user_reports in by_user.values():
+            header = "📊 Дайджест отчетов\n" + self._header(user_reports[-1])
+            with_photo = [r for r in user_reports if r.photo_id]
+            without_photo = [r for r in user_reports if not r.photo_id]
+            for i in range(0, len(with_photo), MEDIA_GROUP_SIZE):
+                chunk = with_photo[i:i + MEDIA_GROUP_SIZE]
+                caption = header + "\n".join(self._line(r) for r in chunk)
+                parts.append((caption[:CAPTION_LIMIT], [r.photo_id for r in chunk]))
+            if without_photo:
+                text = header + "\n".join(self._line(r) for r in without_photo)
+                parts.append((text[:4096], []))
+        return parts
+
+    async def flush(self):
+        if not self._pending:
+            return
+        reports, self._pending = self._pending, []
+        self.digested += len(reports)
+        parts = self._build_digest(reports)
+
+        for admin_id in await role_cache.admin_ids():
+            for text, photos in parts:
+                try:
+                    if len(photos) > 1:
+                        media = [InputMediaPhoto(media=photos[0], caption=text)]
+                        media += [InputMediaPhoto(media=photo) for photo in photos[1:]]
+                        await self._bot.send_media_group(chat_id=admin_id, media=media)
+                    elif photos:
+                        await self._bot.send_photo(chat_id=admin_id, photo=photos[0], caption=text)
+                    else:
+                        await self._bot.send_message(chat_id=admin_id, text=text)
+                    self.messages += 1
+                except Exception as e:
+                    logger.error(f"Ошибка отправки дайджеста админу {admin_id}: {str(e)}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # shield: отмена при остановке не должна прерывать отправку дайджеста
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                logger.error(f"Ошибка отправки дайджеста: {e}")
+
+    async def start(self, bot: Bot):
+        self._bot = bot
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Накопленное и отправляемое в фоне не теряем при остановке
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "sent_immediately": self.sent_immediately,
+            "digested": self.digested,
+            "messages": self.messages,
+        }
+
+
+admin_digest = AdminDigest(interval=ADMIN_DIGEST_INTERVAL, threshold=ADMIN_DIGEST_THRESHOLD)
@@ -0,0 +1,69 @@
+"""Сравнение PostgresStorage с MemoryStorage на типичном обработчике.
+
+Запуск: python -m benchmarks.fsm_storage
+Без POSTGRESURL измеряется только путь через LRU-кэш (без записи в БД).
+"""
+import os
+import time
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from database import db
+from fsm_storage import FSM_DEFAULT_TTL, FSM_SESSION_TTLS, PostgresStorage, _Record
+from migrations import migrate
+
+USERS = 200
+ROUNDS = 20
+
+
+async def handler(storage, key: StorageKey, i: int):
+    # Как в handle_answer: чтение данных, несколько update_data и смена состояния
+    await storage.get_data(key)
+    await storage.update_data(key, {'current_question_index': i})
+    await storage.update_data(key, {'last_message_id': i})
+    await storage.set_state(key, "QuizStates:ANSWERING_QUESTION")
+
+
+async def run(name: str, storage, flush=None):
+    keys = [StorageKey(bot_id=1, chat_id=user_id, user_id=user_id) for user_id in range(USERS)]
+    started = time.perf_counter()
+    for i in range(ROUNDS):
+        for key in keys:
+            await handler(storage, key, i)
+            if flush:
+                await flush()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<32} {elapsed / (USERS * ROUNDS) * 1e6:8.1f} мкс на обработчик")
+
+
+async def main():
+    await run("MemoryStorage", MemoryStorage())
+
+    with_db = bool(os.getenv("POSTGRESURL"))
+    if with_db:
+        await db.connect()
+        await migrate()
+
+    storage = PostgresStorage(
+        db=db,
+        cache_size=USERS * 2,
+        ttls=FSM_SESSION_TTLS,
+        default_ttl=FSM_DEFAULT_TTL,
+        sweep_interval=0
+    )
+    if not with_db:
+        # Без БД заранее заполняем кэш, чтобы все обращения были попаданиями
+        for user_id in range(USERS):
+            key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+            storage._cache[storage.key_builder.build(key)] = _Record()
+    await run("PostgresStorage (LRU, без flush)", storage)
+
+    if with_db:
+        await run("PostgresStorage (flush на апдейт)", storage, flush=storage.flush)
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
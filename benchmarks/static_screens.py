@@ -0,0 +1,69 @@
+"""Сборка клавиатуры на каждое сообщение против готовых экранов из keyboards.py.
+
+Запуск: python -m benchmarks.static_screens
+"""
+import timeit
+
+from aiogram import types
+from aiogram.methods import SendMessage
+from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
+
+from keyboards import CLIMATE, MAIN_MENU_PROMPT
+
+ROUNDS = 20000
+
+
+def main_menu_kb():
+    # Так главное меню собиралось раньше — на каждое сообщение
+    builder = ReplyKeyboardBuilder()
+    buttons = [
+        "🛰 Космическая карта",
+        "🌍 Экологические данные",
+        "📰 Новости",
+        "🗺️ Квест-трип по городу",
+        "🎓 Викторина о космосе",
+        "🏅 Профиль"
+    ]
+    for btn in buttons:
+        builder.add(types.KeyboardButton(text=btn))
+    builder.adjust(2, 2, 2)
+    return builder.as_markup(resize_keyboard=True)
+
+
+def climate_keyboard():
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        types.InlineKeyboardButton(text="Глобальная карта климата", url="https://map.srcms.space/"),
+        types.InlineKeyboardButton(text="Климат в Москве", callback_data="climate_moscow")
+    )
+    builder.row(types.InlineKeyboardButton(text="⬅️ Назад", callback_data="eco_back"))
+    return builder.as_markup()
+
+
+def run(name: str, func):
+    elapsed = timeit.timeit(func, number=ROUNDS)
+    print(f"{name:<40} {elapsed / ROUNDS * 1e6:8.2f} мкс на сообщение")
+    return elapsed
+
+
+def main():
+    # Сравниваем подготовку запроса sendMessage, как ее делает message.answer
+    built = run("Главное меню: сборка", lambda: SendMessage(
+        chat_id=1, text=MAIN_MENU_PROMPT.text, reply_markup=main_menu_kb()
+    ))
+    cached = run("Главное меню: готовый экран", lambda: SendMessage(
+        chat_id=1, text=MAIN_MENU_PROMPT.text, reply_markup=MAIN_MENU_PROMPT.reply_markup
+    ))
+    print(f"Экономия: {(built - cached) / ROUNDS * 1e6:.2f} мкс на сообщение ({built / cached:.1f}x)\n")
+
+    built = run("Климат (inline): сборка", lambda: SendMessage(
+        chat_id=1, text=CLIMATE.text, reply_markup=climate_keyboard()
+    ))
+    cached = run("Климат (inline): готовый экран", lambda: SendMessage(
+        chat_id=1, text=CLIMATE.text, reply_markup=CLIMATE.reply_markup
+    ))
+    print(f"Экономия: {(built - cached) / ROUNDS * 1e6:.2f} мкс на сообщение ({built / cached:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Локальная проверка webhook-сервера синтетическими апдейтами.
+
+Запуск: python -m benchmarks.webhook_load
+Поднимает тот же обработчик webhook и UpdateScheduler, что и в проде, с медленным
+обработчиком: Telegram получает 200 раньше, чем обработчик завершится, а апдейты
+одного чата обрабатываются в порядке поступления.
+"""
+import time
+import asyncio
+
+from aiohttp import ClientSession, web
+from aiogram import Bot, Dispatcher, types
+
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from scheduler import UpdateScheduler
+
+UPDATES = 500
+CONCURRENCY = 20
+HANDLER_DELAY = 0.2
+SECRET = "local-test-secret"
+PORT = 8081
+
+
+def synthetic_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1000 + update_id % 50, "type": "private"},
+            "from": {"id": 1000 + update_id % 50, "is_bot": False, "first_name": "Test"},
+            "text": "📰 Новости",
+        },
+    }
+
+
+async def main():
+    dp = Dispatcher()
+    scheduler = UpdateScheduler(workers=CONCURRENCY, max_backlog=UPDATES)
+    dp.update.outer_middleware(scheduler)
+    bot = Bot(token="123456:local-test")
+    handled = 0
+    last_seen: dict[int, int] = {}
+    out_of_order = 0
+
+    @dp.message()
+    async def slow_handler(message: types.Message):
+        nonlocal handled, out_of_order
+        if message.message_id < last_seen.get(message.chat.id, 0):
+            out_of_order += 1
+        last_seen[message.chat.id] = message.message_id
+        await asyncio.sleep(HANDLER_DELAY)
+        handled += 1
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, handle_in_background=True, secret_token=SECRET
+    ).register(app, path="/webhook")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host="127.0.0.1", port=PORT).start()
+
+    url = f"http://127.0.0.1:{PORT}/webhook"
+    async with ClientSession() as session:
+        async with session.post(url, json=synthetic_update(0)) as response:
+            print(f"Без секрета: HTTP {response.status}")
+
+        latencies = []
+
+        async def post(update_id: int):
+            started = time.perf_counter()
+            async with session.post(
+                url,
+                json=synthetic_update(update_id),
+                headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+            ) as response:
+                assert response.status == 200
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(i) for i in range(1, UPDATES + 1)))
+        accepted = time.perf_counter() - started
+
+        while handled < UPDATES:
+            await asyncio.sleep(0.05)
+        processed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"Принято {UPDATES} апдейтов за {accepted:.2f} с, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} мс, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} мс")
+    print(f"Обработано за {processed:.2f} с (обработчик {HANDLER_DELAY} с, параллельно {CONCURRENCY})")
+    print(f"Планировщик: {scheduler.stats()}, нарушений порядка в чате: {out_of_order}")
+
+    await runner.cleanup()
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
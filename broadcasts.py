@@ -0,0 +1,294 @@
+import os
+import time
+import asyncio
+import logging
+
+import asyncpg
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+
+from database import Database, db
+from media_cache import media_cache
+from outbound import outbound_limiter
+
+logger = logging.getLogger(__name__)
+
+# Сколько получателей читать из БД за раз и как часто обновлять прогресс у админа
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "50"))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+# Сколько ждать завершения текущего пакета при остановке бота
+BROADCAST_STOP_TIMEOUT = float(os.getenv("BROADCAST_STOP_TIMEOUT", "10"))
+# Сколько раз подряд повторять пакет при сбое БД или Telegram и начальная пауза (удваивается)
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "5"))
+BROADCAST_RETRY_DELAY = float(os.getenv("BROADCAST_RETRY_DELAY", "2"))
+
+
+async def send_news_to_user(bot: Bot, user_id: int, news_item: asyncpg.Record) -> bool:
+    # Частоту отправки и повтор после flood control (retry_after) обеспечивает outbound_limiter
+    try:
+        text = f"📰 *{news_item['created_at'].strftime('%d.%m.%Y %H:%M')}*\n\n{news_item['text']}"
+
+        if news_item['photo']:
+            # Картинка по URL загружается один раз, остальным получателям уходит file_id
+            await media_cache.send_photo(
+                bot,
+                news_item['photo'],
+                chat_id=user_id,
+                caption=text,
+                parse_mode="Markdown"
+            )
+        else:
+            await bot.send_message(
+                chat_id=user_id,
+                text=text,
+                parse_mode="Markdown"
+            )
+        return True
+
+    except TelegramAPIError as e:
+        logger.warning(f"Failed to send news to user {user_id}: {e}")
+        return False
+
+    except Exception as e:
+        logger.error(f"Critical error for user {user_id}: {type(e).__name__} - {str(e)}")
+        return False
+
+
+class BroadcastEngine:
+    """Рассылка новостей, которая переживает перезапуск.
+
+    Задание и курсор (id последнего получателя) хранятся в broadcast_jobs.
+    Получатели читаются пакетами по возрастанию id, после каждого пакета
+    курсор сохраняется, поэтому после рестарта повторно может уйти не больше
+    одного пакета. Соединение с БД берется только на время запросов.
+
+    При сбое рассылка продолжается с курсора после паузы, которая растет с
+    каждой неудачей подряд. Если повторы кончились, задание помечается
+    failed и остается так до ручного resume(): при старте бота оно не
+    перезапускается, иначе вечная ошибка повторялась бы после каждого рестарта.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        batch_size: int,
+        progress_interval: float,
+        stop_timeout: float,
+        max_retries: int,
+        retry_delay: float
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.stop_timeout = stop_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._bot: Bot | None = None
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._stopping = False
+
+    async def submit(self, news: asyncpg.Record, admin_chat_id: int, admin_message_id: int) -> int:
+        """Создает задание и сразу запускает его в фоне"""
+        async with self.db.acquire() as conn:
+            job = await conn.fetchrow(
+                """INSERT INTO broadcast_jobs (news_id, admin_chat_id, admin_message_id, total_users)
+                VALUES ($1, $2, $3, (SELECT count(*) FROM users WHERE NOT is_banned))
+                RETURNING *""",
+                news['id'], admin_chat_id, admin_message_id
+            )
+        self._spawn(job, news)
+        return job['id']
+
+    def _spawn(self, job: asyncpg.Record, news: asyncpg.Record):
+        task = asyncio.create_task(self._run(job, news))
+        self._tasks[job['id']] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job['id'], None))
+
+    async def _report(self, job: dict, news: asyncpg.Record, finished: bool, error: str | None = None):
+        done = job['success_count'] + job['failed_count']
+        if error is not None:
+            text = (
+                f"⚠️ Рассылка прервана: {done} / {job['total_users']}\n"
+                f"• Успешно: {job['success_count']}\n"
+                f"• Не доставлено: {job['failed_count']}\n"
+                f"Ошибка: {error}\n"
+                f"Продолжить с этого места: /resumebroadcast {job['id']}"
+            )
+        elif finished:
+            text = (
+                f"📊 Статус рассылки:\n"
+                f"• Успешно: {job['success_count']}\n"
+                f"• Не доставлено: {job['failed_count']}\n"
+                f"• Всего получателей: {done}"
+            )
+        else:
+            text = (
+                f"📤 Идет рассылка: {done} / {job['total_users']}\n"
+                f"• Успешно: {job['success_count']}\n"
+                f"• Не доставлено: {job['failed_count']}"
+            )
+        text += f"\n\nТекст новости:\n{news['text'][:300]}..."
+
+        try:
+            if news['photo']:
+                await self._bot.edit_message_caption(
+                    chat_id=job['admin_chat_id'], message_id=job['admin_message_id'], caption=text
+                )
+            else:
+                await self._bot.edit_message_text(
+                    chat_id=job['admin_chat_id'], message_id=job['admin_message_id'], text=text
+                )
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.warning(f"Не удалось обновить прогресс рассылки {job['id']}: {e}")
+
+    async def _run(self, job: asyncpg.Record, news: asyncpg.Record):
+        job = dict(job)
+        failures = 0
+        while True:
+            cursor = job['last_user_id']
+            try:
+                await self._deliver(job, news)
+                return
+            except Exception as e:
+                # Считаем только неудачи подряд: пакет, который успел уйти, сбрасывает счетчик
+                failures = 1 if job['last_user_id'] != cursor else failures + 1
+                if self._stopping:
+                    # Задание остается в статусе running и продолжится при следующем запуске
+                    logger.error(f"Ошибка рассылки {job['id']} при остановке: {e}")
+                    return
+                if failures > self.max_retries:
+                    logger.error(f"Рассылка {job['id']} прервана после {self.max_retries} повторов: {e}")
+                    await self._fail(job, news, e)
+                    return
+                delay = self.retry_delay * 2 ** (failures - 1)
+                logger.warning(f"Ошибка рассылки {job['id']}, повтор через {delay:g} с: {e}")
+                await asyncio.sleep(delay)
+
+    async def _fail(self, job: dict, news: asyncpg.Record, error: Exception):
+        try:
+            async with self.db.acquire() as conn:
+                await conn.execute(
+                    """UPDATE broadcast_jobs
+                    SET status = 'failed', last_user_id = $2, success_count = $3, failed_count = $4
+                    WHERE id = $1""",
+                    job['id'], job['last_user_id'], job['success_count'], job['failed_count']
+                )
+        except Exception as e:
+            # Без записи статуса задание останется running — start() подхватит его так же
+            logger.error(f"Не удалось отметить рассылку {job['id']} как failed: {e}")
+        try:
+            await self._report(job, news, finished=False, error=str(error))
+        except Exception as e:
+            logger.warning(f"Не удалось сообщить о сбое рассылки {job['id']}: {e}")
+
+    async def _deliver(self, job: dict, news: asyncpg.Record):
+        """Шлет пакеты с курсора job['last_user_id'] и обновляет job на месте"""
+        reported_at = time.monotonic()
+        while not self._stopping:
+            async with self.db.acquire() as conn:
+                users = await conn.fetch(
+                    "SELECT id FROM users WHERE NOT is_banned AND id > $1 ORDER BY id LIMIT $2",
+                    job['last_user_id'], self.batch_size
+                )
+            if not users:
+                break
+
+            # Рассылка идет с фоновым приоритетом: ответы пользователям ее опережают
+            with outbound_limiter.bulk():
+                results = await asyncio.gather(
+                    *[send_news_to_user(self._bot, user['id'], news) for user in users]
+                )
+            job['last_user_id'] = users[-1]['id']
+            job['success_count'] += sum(results)
+            job['failed_count'] += len(results) - sum(results)
+
+            async with self.db.acquire() as conn:
+                await conn.execute(
+                    """UPDATE broadcast_jobs
+                    SET last_user_id = $2, success_count = $3, failed_count = $4
+                    WHERE id = $1""",
+                    job['id'], job['last_user_id'], job['success_count'], job['failed_count']
+                )
+
+            if time.monotonic() - reported_at >= self.progress_interval:
+                reported_at = time.monotonic()
+                await self._report(job, news, finished=False)
+
+        if self._stopping:
+            logger.info(f"Рассылка {job['id']} приостановлена на получателе {job['last_user_id']}")
+            return
+
+        async with self.db.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "UPDATE broadcast_jobs SET status = 'done', finished_at = now() WHERE id = $1",
+                    job['id']
+                )
+                await conn.execute(
+                    """INSERT INTO news_delivery_logs
+                    (news_id, total_users, success_count)
+                    VALUES ($1, $2, $3)""",
+                    news['id'], job['success_count'] + job['failed_count'], job['success_count']
+                )
+        try:
+            await self._report(job, news, finished=True)
+        except Exception as e:
+            # Задание уже done: повтор записал бы итог рассылки второй раз
+            logger.warning(f"Не удалось отправить итог рассылки {job['id']}: {e}")
+        logger.info(f"Рассылка {job['id']} завершена: {job['success_count']} успешно, "
+                    f"{job['failed_count']} не доставлено")
+
+    async def start(self, bot: Bot):
+        """Продолжает рассылки, прерванные остановкой бота; failed ждут resume()"""
+        self._bot = bot
+        self._stopping = False
+        async with self.db.acquire() as conn:
+            jobs = await conn.fetch("SELECT * FROM broadcast_jobs WHERE status = 'running' ORDER BY id")
+            if not jobs:
+                return
+            news = {
+                row['id']: row for row in await conn.fetch(
+                    "SELECT * FROM news WHERE id = ANY($1::int[])", [job['news_id'] for job in jobs]
+                )
+            }
+        for job in jobs:
+            logger.info(f"Продолжаем рассылку {job['id']} с получателя {job['last_user_id']}")
+            self._spawn(job, news[job['news_id']])
+
+    async def resume(self, job_id: int) -> bool:
+        """Перезапускает рассылку в статусе failed с ее курсора; False, если такой нет"""
+        async with self.db.acquire() as conn:
+            job = await conn.fetchrow(
+                """UPDATE broadcast_jobs SET status = 'running'
+                WHERE id = $1 AND status = 'failed'
+                RETURNING *""",
+                job_id
+            )
+            if job is None:
+                return False
+            news = await conn.fetchrow("SELECT * FROM news WHERE id = $1", job['news_id'])
+        logger.info(f"Рассылка {job_id} возобновлена с получателя {job['last_user_id']}")
+        self._spawn(job, news)
+        return True
+
+    async def stop(self):
+        """Дает текущим пакетам дослаться и сохранить курсор, остальное доделает следующий запуск"""
+        self._stopping = True
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=self.stop_timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+broadcast_engine = BroadcastEngine(
+    db=db,
+    batch_size=BROADCAST_BATCH_SIZE,
+    progress_interval=BROADCAST_PROGRESS_INTERVAL,
+    stop_timeout=BROADCAST_STOP_TIMEOUT,
+    max_retries=BROADCAST_MAX_RETRIES,
+    retry_delay=BROADCAST_RETRY_DELAY
+)
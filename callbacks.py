@@ -0,0 +1,124 @@
+import logging
+from typing import Any
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject, CallbackType
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+from text_routes import ANY_STATE, state_key
+
+logger = logging.getLogger(__name__)
+
+# Формат callback_data: "<действие>:<число>:<число>..." — короткий код и небольшие
+# неотрицательные числа. Декодируется один раз, дальше поиск в таблице действий.
+SEPARATOR = ":"
+MAX_CALLBACK_DATA = 64
+
+# Коды действий общие для всех роутеров и не должны повторяться
+NEXT_TASK = "n"
+CONTINUE_TASK = "c"
+QUIZ_ANSWER = "a"
+QUIZ_CATEGORY = "k"
+
+# Действие -> таблица, в которой оно зарегистрировано
+_owners: dict[str, "CallbackActions"] = {}
+
+
+def pack(action: str, *args: int) -> str:
+    data = SEPARATOR.join((action, *map(str, args)))
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data!r}")
+    return data
+
+
+def unpack(data: str | None) -> tuple[str, tuple[int, ...]] | None:
+    """Разбирает callback_data; None для битых данных"""
+    if not data:
+        return None
+    action, *raw = data.split(SEPARATOR)
+    for value in raw:
+        # isdigit() пропускает '²' и '①', которые int() не разбирает
+        if not (value.isascii() and value.isdecimal()):
+            return None
+    return action, tuple(map(int, raw))
+
+
+class _Action:
+    __slots__ = ('handler', 'arity')
+
+    def __init__(self, handler: CallableObject, arity: int):
+        self.handler = handler
+        self.arity = arity
+
+
+async def reject_callback(callback: CallbackQuery):
+    # Кнопка из старого сообщения или подделанные данные — просто закрываем «часики»
+    await callback.answer("⚠️ Кнопка устарела")
+
+
+_REJECT = CallableObject(reject_callback)
+
+
+class CallbackActions:
+    """Таблица действий для callback-кнопок роутера.
+
+    На роутере регистрируется один хендлер callback_query: данные
+    декодируются один раз, обработчик ищется по (состоянию, действию).
+    Таблица с `reject_unknown=True` отвечает на битые, неизвестные и
+    устаревшие кнопки (не в том состоянии или с другим числом аргументов).
+    """
+
+    def __init__(self, router: Router, reject_unknown: bool = False):
+        self.router = router
+        self.reject_unknown = reject_unknown
+        self._actions: dict[tuple[str | None, str], _Action] = {}
+        router.callback_query.register(self._handle, self._match)
+
+    def __call__(self, action: str, arity: int = 0, state: State | str | None = ANY_STATE):
+        """Декоратор: `@actions(QUIZ_ANSWER, arity=2, state=QuizStates.ANSWERING_QUESTION)`"""
+        key_state = state_key(state)
+
+        def decorator(callback: CallbackType) -> CallbackType:
+            owner = _owners.setdefault(action, self)
+            if owner is not self:
+                logger.warning(
+                    f"Действие {action!r} уже зарегистрировано в {owner.router.name}, "
+                    f"{callback.__name__} не будет вызван"
+                )
+                return callback
+            key = (key_state, action)
+            if key in self._actions:
+                logger.warning(
+                    f"Действие {action!r} (состояние {key_state}) уже обрабатывает "
+                    f"{self._actions[key].handler.callback.__name__}, {callback.__name__} не будет вызван"
+                )
+                return callback
+            self._actions[key] = _Action(CallableObject(callback), arity)
+            return callback
+
+        return decorator
+
+    async def _match(self, callback: CallbackQuery, raw_state: str | None = None) -> bool | dict[str, Any]:
+        decoded = unpack(callback.data)
+        owner = _owners.get(decoded[0]) if decoded else None
+        if owner is not self:
+            # Чужое действие пропускаем дальше, битое — отклоняем в основной таблице
+            if owner is None and self.reject_unknown:
+                return {"action_handler": _REJECT, "action_args": ()}
+            return False
+
+        action, args = decoded
+        entry = self._actions.get((raw_state, action)) or self._actions.get((ANY_STATE, action))
+        if entry is None or entry.arity != len(args):
+            return {"action_handler": _REJECT, "action_args": ()}
+        return {"action_handler": entry.handler, "action_args": args}
+
+    async def _handle(
+        self,
+        callback: CallbackQuery,
+        action_handler: CallableObject,
+        action_args: tuple[int, ...],
+        **kwargs: Any
+    ) -> Any:
+        return await action_handler.call(callback, *action_args, **kwargs)
@@ -1,21 +1,100 @@
 import os
+import time
+import logging
+from contextlib import asynccontextmanager
 
 import asyncpg
-from asyncpg import create_pool
+
+logger = logging.getLogger(__name__)
 
 POSTGRES_URI = os.getenv("POSTGRESURL")
 DB_USER = os.getenv("DATABASE_USER")
 DB_PASSWORD = os.getenv("DATABASE_PASSWORD")
 
-async def get_db():
-    try:
-        conn = await asyncpg.connect(
+# Настройки пула соединений
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "10"))
+
+
+class Database:
+    """Общий пул соединений asyncpg на весь процесс"""
+
+    def __init__(self, min_size: int, max_size: int, acquire_timeout: float):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.pool: asyncpg.Pool | None = None
+        # Статистика ожидания свободного соединения
+        self.acquire_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def connect(self):
+        if self.pool is not None:
+            return
+        self.pool = await asyncpg.create_pool(
+            dsn=POSTGRES_URI,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            timeout=10  # Таймаут установки соединения
+        )
+        logger.info(f"Пул PostgreSQL создан: {self.min_size}..{self.max_size} соединений")
+
+    async def connect_dedicated(self) -> asyncpg.Connection:
+        """Отдельное соединение вне пула — для долгих подписок вроде LISTEN"""
+        return await asyncpg.connect(
             dsn=POSTGRES_URI,
             user=DB_USER,
             password=DB_PASSWORD,
-            timeout=10  # Установите таймаут 10 секунд
+            timeout=10
         )
-        print("Успешное подключение к PostgreSQL!")
-        return conn
-    except Exception as e:
-        raise
\ No newline at end of file
+
+    async def close(self):
+        if self.pool is None:
+            return
+        await self.pool.close()
+        self.pool = None
+        logger.info("Пул PostgreSQL закрыт")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Берет соединение из пула и учитывает время ожидания"""
+        if self.pool is None:
+            raise RuntimeError("Пул соединений не инициализирован")
+        started = time.perf_counter()
+        async with self.pool.acquire(timeout=self.acquire_timeout) as conn:
+            waited = time.perf_counter() - started
+            self.acquire_count += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            yield conn
+
+    def stats(self) -> dict:
+        return {
+            "size": self.pool.get_size() if self.pool else 0,
+            "idle": self.pool.get_idle_size() if self.pool else 0,
+            "max_size": self.max_size,
+            "acquired": self.acquire_count,
+            "wait_avg_ms": self.wait_total / self.acquire_count * 1000 if self.acquire_count else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+        }
+
+
+db = Database(
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    acquire_timeout=DB_ACQUIRE_TIMEOUT
+)
+
+
+async def on_startup(dispatcher):
+    await db.connect()
+    # Пул доступен в обработчиках как аргумент `db`
+    dispatcher["db"] = db
+
+
+async def on_shutdown():
+    await db.close()
@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Mapping
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+# Сколько сессий держать в памяти перед PostgreSQL
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+# Как часто искать брошенные сессии
+FSM_SWEEP_INTERVAL = float(os.getenv("FSM_SWEEP_INTERVAL", "300"))
+# Время жизни неактивной сессии (сек) для остальных групп и сессий без состояния
+FSM_DEFAULT_TTL = float(os.getenv("FSM_DEFAULT_TTL", "86400"))
+
+
+def _parse_ttls(value: str) -> dict[str, float]:
+    """FSM_SESSION_TTLS в формате "QuestStates=604800,NewsStates=900" """
+    ttls = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        group, _, seconds = item.partition("=")
+        ttls[group.strip()] = float(seconds)
+    return ttls
+
+
+# Время жизни неактивной сессии по группам состояний
+FSM_SESSION_TTLS = {
+    "QuestStates": 7 * 86400,  # прогресс квеста дублируется в user_progress
+    "QuizStates": 86400,
+    "NewsStates": 900,
+    "EcoState": 3600,
+    "MapStates": 3600,
+    **_parse_ttls(os.getenv("FSM_SESSION_TTLS", "")),
+}
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'touched')
+
+    def __init__(self, state: str | None = None, data: dict | None = None):
+        self.state = state
+        self.data = data or {}
+        self.touched = time.monotonic()
+
+
+class PostgresStorage(BaseStorage):
+    """FSM-хранилище в PostgreSQL (строка на ключ, данные в JSONB) с LRU-кэшем в памяти.
+
+    Изменения копятся в памяти и пишутся одним пакетным UPSERT в flush(),
+    который FSMFlushMiddleware вызывает после обработки каждого апдейта.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        cache_size: int,
+        ttls: dict[str, float],
+        default_ttl: float,
+        sweep_interval: float,
+        key_builder: KeyBuilder | None = None
+    ):
+        self.db = db
+        self.cache_size = cache_size
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.sweep_interval = sweep_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache: OrderedDict[str, _Record] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._sweeper: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.evicted_keys = 0
+        self.reclaimed_bytes = 0
+
+    async def _record(self, key: StorageKey) -> tuple[str, _Record]:
+        storage_key = self.key_builder.build(key)
+        record = self._cache.get(storage_key)
+        if record is not None:
+            self.hits += 1
+            record.touched = time.monotonic()
+            self._cache.move_to_end(storage_key)
+            return storage_key, record
+
+        self.misses += 1
+        async with self.db.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT state, data FROM fsm_storage WHERE key = $1",
+                storage_key
+            )
+        # Пока шел запрос, запись могли создать параллельно
+        record = self._cache.get(storage_key)
+        if record is None:
+            record = _Record(row['state'], json.loads(row['data'])) if row else _Record()
+            self._cache[storage_key] = record
+            self._evict()
+        return storage_key, record
+
+    def _evict(self):
+        # Несохраненные записи не вытесняем, они уйдут в БД при ближайшем flush()
+        while len(self._cache) > self.cache_size:
+            for storage_key in self._cache:
+                if storage_key not in self._dirty:
+                    del self._cache[storage_key]
+                    break
+            else:
+                return
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._dirty.add(storage_key)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        _, record = await self._record(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        storage_key, record = await self._record(key)
+        record.data = data.copy()
+        self._dirty.add(storage_key)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, record = await self._record(key)
+        return record.data.copy()
+
+    async def flush(self):
+        """Пишет все измененные сессии одним UPSERT и одним DELETE"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+
+            upsert_keys, states, payloads, delete_keys = [], [], [], []
+            for storage_key in dirty:
+                record = self._cache.get(storage_key)
+                if record is None or (record.state is None and not record.data):
+                    delete_keys.append(storage_key)
+                else:
+                    upsert_keys.append(storage_key)
+                    states.append(record.state)
+                    payloads.append(json.dumps(record.data, ensure_ascii=False, default=str))
+
+            try:
+                async with self.db.acquire() as conn:
+                    if upsert_keys:
+                        await conn.execute(
+                            """INSERT INTO fsm_storage (key, state, data, updated_at)
+                            SELECT k, s, d, now()
+                            FROM unnest($1::text[], $2::text[], $3::jsonb[]) AS v(k, s, d)
+                            ON CONFLICT (key) DO UPDATE
+                            SET state = EXCLUDED.state, data = EXCLUDED.data, updated_at = now()""",
+                            upsert_keys, states, payloads
+                        )
+                    if delete_keys:
+                        await conn.execute(
+                            "DELETE FROM fsm_storage WHERE key = ANY($1::text[])",
+                            delete_keys
+                        )
+            except Exception as e:
+                # Повторим при следующем flush()
+                self._dirty |= dirty
+                logger.error(f"Ошибка сохранения FSM ({len(dirty)} сессий): {e}")
+
+    async def close(self) -> None:
+        await self.flush()
+
+    def ttl(self, state: str | None) -> float:
+        group = state.split(":", 1)[0] if state else None
+        return self.ttls.get(group, self.default_ttl)
+
+    async def sweep(self):
+        """Удаляет сессии, неактивные дольше TTL своей группы состояний.
+
+        Один проход по кэшу в памяти и один DELETE по индексу updated_at
+        вместо таймера на каждый ключ.
+        """
+        now = time.monotonic()
+        # Одна сессия может уйти и из памяти, и из БД — считаем ее один раз
+        evicted: set[str] = set()
+        reclaimed = 0
+
+        # Память: выбрасываем простаивающие сохраненные записи
+        for storage_key, record in list(self._cache.items()):
+            if storage_key in self._dirty or now - record.touched < self.ttl(record.state):
+                continue
+            del self._cache[storage_key]
+            if record.state is not None or record.data:
+                evicted.add(storage_key)
+                reclaimed += len(json.dumps(record.data, ensure_ascii=False, default=str))
+
+        # БД: строки, которые не обновлялись дольше TTL своей группы
+        groups = list(self.ttls)
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch(
+                """DELETE FROM fsm_storage f
+                WHERE f.updated_at < now() - make_interval(secs => $4)
+                  AND f.updated_at < now() - make_interval(secs => COALESCE(
+                      (SELECT t.ttl FROM unnest($1::text[], $2::float8[]) AS t(grp, ttl)
+                       WHERE t.grp = split_part(f.state, ':', 1)),
+                      $3))
+                RETURNING f.key, octet_length(f.data::text) AS size""",
+                groups, [float(self.ttls[group]) for group in groups],
+                float(self.default_ttl), float(min([self.default_ttl, *self.ttls.values()]))
+            )
+
+        for row in rows:
+            record = self._cache.get(row['key'])
+            if record is not None:
+                # Сессию читали недавно, но не меняли — возвращаем строку в БД
+                self._dirty.add(row['key'])
+                continue
+            if row['key'] not in evicted:
+                evicted.add(row['key'])
+                reclaimed += row['size']
+
+        self.evicted_keys += len(evicted)
+        self.reclaimed_bytes += reclaimed
+        if evicted:
+            logger.info(f"Удалено неактивных FSM-сессий: {len(evicted)}, освобождено {reclaimed} байт")
+
+    async def _run_sweeper(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка очистки FSM-сессий: {e}")
+
+    async def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._run_sweeper())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted_keys": self.evicted_keys,
+            "reclaimed_bytes": self.reclaimed_bytes,
+        }
+
+
+class FSMFlushMiddleware(BaseMiddleware):
+    """Сохраняет изменения FSM после обработки апдейта: несколько update_data — один UPSERT"""
+
+    def __init__(self, storage: PostgresStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any]
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            await self.storage.flush()
+
+
+fsm_storage = PostgresStorage(
+    db=db,
+    cache_size=FSM_CACHE_SIZE,
+    ttls=FSM_SESSION_TTLS,
+    default_ttl=FSM_DEFAULT_TTL,
+    sweep_interval=FSM_SWEEP_INTERVAL
+)
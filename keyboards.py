@@ -1,18 +1,164 @@
-import types
+from aiogram import types
+from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 
-from aiogram.utils.keyboard import ReplyKeyboardBuilder
+# Статичные клавиатуры и экраны собираются один раз при импорте и
+# отдаются во все сообщения всех пользователей.
+# ВАЖНО: ReplyKeyboardMarkup и InlineKeyboardMarkup в aiogram изменяемые
+# (MutableTelegramObject). Эти объекты общие, их нельзя менять на месте:
+# правка кнопки изменит ее во всех следующих ответах. Для своей версии
+# клавиатуры соберите новую или возьмите копию: MAIN_MENU_KB.model_copy(deep=True).
 
-def main_menu_kb():
+
+class Screen:
+    """Общая пара текст + клавиатура; как и клавиатуры выше, не меняется после импорта"""
+    __slots__ = ('text', 'reply_markup')
+
+    def __init__(self, text: str, reply_markup=None):
+        self.text = text
+        self.reply_markup = reply_markup
+
+    async def answer(self, message: types.Message, **kwargs) -> types.Message:
+        return await message.answer(self.text, reply_markup=self.reply_markup, **kwargs)
+
+
+def _reply_kb(buttons: list[str], *sizes: int, **kwargs) -> types.ReplyKeyboardMarkup:
     builder = ReplyKeyboardBuilder()
-    buttons = [
-        "🛰 Космическая карта",
-        "🌍 Экологические данные",
-        "📰 Новости",
-        "🗺️ Квест-трип по городу",
-        "🎓 Викторина о космосе",
-        "🏅 Профиль"
-    ]
     for btn in buttons:
         builder.add(types.KeyboardButton(text=btn))
-    builder.adjust(2, 2, 2)
-    return builder.as_markup(resize_keyboard=True)
\ No newline at end of file
+    if sizes:
+        builder.adjust(*sizes)
+    return builder.as_markup(resize_keyboard=True, **kwargs)
+
+
+def _inline_rows(*rows: list[types.InlineKeyboardButton]) -> types.InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for row in rows:
+        builder.row(*row)
+    return builder.as_markup()
+
+
+ECO_BACK_BUTTON = types.InlineKeyboardButton(text="⬅️ Назад", callback_data="eco_back")
+
+# region Клавиатуры
+
+MAIN_MENU_KB = _reply_kb([
+    "🛰 Космическая карта",
+    "🌍 Экологические данные",
+    "📰 Новости",
+    "🗺️ Квест-трип по городу",
+    "🎓 Викторина о космосе",
+    "🏅 Профиль"
+], 2, 2, 2)
+
+ECO_CATEGORIES_KB = _reply_kb([
+    "Лесные пожары",
+    "Загрязнение воздуха",
+    "Изменение климата",
+    "Назад в главное меню"
+], 1, 1, 1, 1, one_time_keyboard=True)
+
+CLIMATE_KB = _inline_rows(
+    [
+        types.InlineKeyboardButton(text="Глобальная карта климата", url="https://map.srcms.space/"),
+        types.InlineKeyboardButton(text="Климат в Москве", callback_data="climate_moscow"),
+    ],
+    [ECO_BACK_BUTTON]
+)
+
+AIR_QUALITY_KB = _inline_rows(
+    [types.InlineKeyboardButton(text="Глобальная карта AQI", url="https://www.iqair.com/ru/earth?nav=")],
+    [ECO_BACK_BUTTON]
+)
+
+WILDFIRES_KB = _inline_rows(
+    [types.InlineKeyboardButton(
+        text="Карта лесных пожаров",
+        url="https://firms.modaps.eosdis.nasa.gov/map/#d:24hrs;@97.1,33.5,3.0z"
+    )],
+    [ECO_BACK_BUTTON]
+)
+
+MOSCOW_CLIMATE_KB = _reply_kb(["⬅️ Назад"])
+
+MAP_MENU_KB = _reply_kb([
+    "Найти спутник",
+    "Показать карту всех спутников",
+    "Назад в главное меню"
+], 2)
+
+SATELLITE_INFO_KB = _reply_kb(["Назад к списку"])
+
+# endregion
+
+# region Экраны
+
+WELCOME = Screen(
+    "🚀 Привет, космический путешественник! 🚀\n\n"
+    "Добро пожаловать в чат-бот SR space, твой личный космический центр управления!\n\n"
+    "Меня зовут Спэйси! От лица всей команды рад приветствовать! Я здесь, чтобы сделать космос ближе для тебя.\n"
+    "🔹 /map — Космическая карта спутников 🛰\n"
+    "🔹 /news — Свежие новости о космосе 📰\n"
+    "🔹 /eco — Данные о загрязнении и климате 🌍\n"
+    "🔹 /quest — Космический квест-трип по твоему городу 🗺️\n"
+    "🔹 /quiz — Викторина о космосе 🎓\n"
+    "🔹 /profile — Твой личный профиль 🏅"
+)
+MAIN_MENU_PROMPT = Screen("Выбери команду или нажми на кнопку ниже ⬇️", MAIN_MENU_KB)
+BACK_TO_MAIN_MENU = Screen("Вы вернулись в главное меню:", MAIN_MENU_KB)
+
+ECO_INTRO = Screen(
+    "🌍 Экологический мониторинг\n\n"
+    "Я могу показать данные о состоянии окружающей среды в реальном времени! Выберите, что вас интересует:"
+)
+ECO_CATEGORIES = Screen("Выберите категорию ниже:", ECO_CATEGORIES_KB)
+WILDFIRES = Screen(
+    "🔥 Мониторинг лесных пожаров\n\n"
+    "Актуальные данные о лесных пожарах:",
+    WILDFIRES_KB
+)
+AIR_QUALITY = Screen(
+    "🌫️ Качество воздуха\n\n"
+    "Я могу показать актуальную информацию о качестве воздуха:",
+    AIR_QUALITY_KB
+)
+CLIMATE = Screen(
+    "🌡 Данные о климате\n\n"
+    "🌍 Я могу показать изменения температуры и климатические тренды:",
+    CLIMATE_KB
+)
+MOSCOW_CLIMATE = Screen(
+    "🌆 Климатические изменения в Москве\n\n"
+    "📅 Последние 5 лет:\n\n"
+    "🌡 Средняя температура:\n"
+    "2020: +7.3°C 🌡\n"
+    "2025: +8.1°C 📈\n"
+    "📊 Разница: +0.8°C\n\n"
+    "💧 Уровень осадков:\n"
+    "2020: 707 мм ☔\n"
+    "2025: 750 мм 📈\n"
+    "📊 Разница: +6%\n\n"
+    "🔥 Количество аномально жарких дней:\n"
+    "2020: 14 дней ☀️\n"
+    "2025: 23 дня 🔥\n"
+    "📊 Разница: +9 дней\n\n"
+    "🔗 Подробнее: https://climate.nasa.gov/",
+    MOSCOW_CLIMATE_KB
+)
+
+SPACE_MAP = Screen(
+    "🌌 Добро пожаловать в раздел космической карты!\n"
+    "Здесь вы можете отслеживать спутники SR Space и другие объекты.",
+    MAP_MENU_KB
+)
+MAP_MENU_BACK = Screen("Возвращаемся в меню карты:", MAP_MENU_KB)
+SATELLITES_MAP = Screen(
+    "🛰 Глобальная карта спутников\n"
+    "\n"
+    "🔍 Здесь можно увидеть все активные спутники в реальном времени!\n"
+    "📡 Карта обновляется автоматически и показывает траектории движения.\n"
+    "\n"
+    "🔗https://spacegid.com/media/space_sattelite/",
+    MAIN_MENU_KB
+)
+
+# endregion
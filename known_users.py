@@ -0,0 +1,106 @@
+import os
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+
+from database import Database, db
+from write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+# Как часто и при каком размере очереди записывать новых пользователей
+KNOWN_USERS_FLUSH_INTERVAL = float(os.getenv("KNOWN_USERS_FLUSH_INTERVAL", "1"))
+KNOWN_USERS_FLUSH_SIZE = int(os.getenv("KNOWN_USERS_FLUSH_SIZE", "200"))
+# Сколько записанных id копить в множестве, прежде чем влить их в отсортированный массив
+KNOWN_USERS_MERGE_SIZE = int(os.getenv("KNOWN_USERS_MERGE_SIZE", "5000"))
+
+
+def _merge_sorted(ids: array, new_ids: list[int]) -> array:
+    """Вливает отсортированные new_ids в ids кусками-срезами: копирование идет в C,
+    а на Python приходится только по одному bisect на новый id"""
+    merged = array('q')
+    start = 0
+    for user_id in new_ids:
+        i = bisect_left(ids, user_id, start)
+        merged.extend(ids[start:i])
+        merged.append(user_id)
+        start = i
+    merged.extend(ids[start:])
+    return merged
+
+
+class KnownUsers(WriteBehindBuffer):
+    """Множество id зарегистрированных пользователей (8 байт на id) с пакетной регистрацией новых"""
+
+    def __init__(self, db: Database, flush_interval: float, flush_size: int, merge_size: int):
+        super().__init__(flush_interval)
+        self.db = db
+        self.flush_size = flush_size
+        self.merge_size = merge_size
+        # Отсортированный компактный массив id, уже записанных в БД
+        self._ids = array('q')
+        # Недавно записанные id, еще не влитые в массив
+        self._fresh: set[int] = set()
+        # Новые пользователи, ожидающие INSERT: id -> username
+        self._pending: dict[int, str] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def __contains__(self, user_id: int) -> bool:
+        if user_id in self._pending or user_id in self._fresh:
+            return True
+        i = bisect_left(self._ids, user_id)
+        return i < len(self._ids) and self._ids[i] == user_id
+
+    def __len__(self):
+        return len(self._ids) + len(self._fresh) + len(self._pending)
+
+    async def load(self):
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch("SELECT id FROM users ORDER BY id")
+        self._ids = array('q', (row['id'] for row in rows))
+        self._fresh.clear()
+        logger.info(f"Загружено {len(self._ids)} известных пользователей")
+
+    def register(self, user_id: int, username: str) -> bool:
+        """Ставит нового пользователя в очередь на запись. False — если он уже известен"""
+        if user_id in self:
+            return False
+        self._pending[user_id] = username
+        if len(self._pending) >= self.flush_size:
+            self.wake()
+        return True
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch = dict(self._pending)
+            try:
+                async with self.db.acquire() as conn:
+                    await conn.execute(
+                        """INSERT INTO users (id, username)
+                        SELECT * FROM unnest($1::bigint[], $2::varchar[])
+                        ON CONFLICT (id) DO NOTHING""",
+                        list(batch.keys()), list(batch.values())
+                    )
+            except Exception as e:
+                # Пользователи остаются в очереди до следующей попытки
+                logger.error(f"Ошибка регистрации пользователей ({len(batch)}): {e}")
+                return
+
+            for user_id in batch:
+                self._pending.pop(user_id, None)
+            self._fresh.update(batch)
+            # Перестройка массива — редкая: раз в merge_size новых пользователей
+            if len(self._fresh) >= self.merge_size:
+                self._ids = _merge_sorted(self._ids, sorted(self._fresh))
+                self._fresh.clear()
+
+
+known_users = KnownUsers(
+    db=db,
+    flush_interval=KNOWN_USERS_FLUSH_INTERVAL,
+    flush_size=KNOWN_USERS_FLUSH_SIZE,
+    merge_size=KNOWN_USERS_MERGE_SIZE
+)
@@ -0,0 +1,54 @@
+import logging
+
+from sortedcontainers import SortedList
+
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+
+class Leaderboard:
+    """Рейтинг пользователей в памяти: топ-K и место пользователя за O(log n)"""
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._points: dict[int, int] = {}
+        self._names: dict[int, str] = {}
+        # Ключи вида (-баллы, id): первые элементы — лидеры рейтинга
+        self._ranked = SortedList()
+
+    async def load(self):
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch("SELECT id, username, points FROM users")
+
+        self._points = {row['id']: row['points'] or 0 for row in rows}
+        self._names = {row['id']: row['username'] for row in rows}
+        self._ranked = SortedList((-points, user_id) for user_id, points in self._points.items())
+        logger.info(f"Рейтинг загружен: {len(self._points)} пользователей")
+
+    def add_user(self, user_id: int, username: str | None):
+        if user_id not in self._points:
+            self._points[user_id] = 0
+            self._ranked.add((0, user_id))
+        self._names[user_id] = username
+
+    def add_points(self, user_id: int, delta: int):
+        if user_id not in self._points:
+            self.add_user(user_id, None)
+        old = self._points[user_id]
+        self._ranked.remove((-old, user_id))
+        self._points[user_id] = old + delta
+        self._ranked.add((-(old + delta), user_id))
+
+    def top(self, k: int) -> list[tuple[str | None, int]]:
+        return [(self._names.get(user_id), -neg_points) for neg_points, user_id in self._ranked[:k]]
+
+    def rank(self, user_id: int) -> tuple[int, int] | None:
+        """Место пользователя (одинаковые баллы делят место) и общее число участников"""
+        points = self._points.get(user_id)
+        if points is None:
+            return None
+        return self._ranked.bisect_left((-points,)) + 1, len(self._ranked)
+
+
+leaderboard = Leaderboard(db)
@@ -1,130 +1,106 @@
 import os
 import logging
 import traceback
-import urllib
-import asyncpg
-from aiogram import Bot, Dispatcher, types, F, Router, filters
-from aiogram.client import bot
-from aiogram.fsm import state
+from collections import OrderedDict
+from aiogram import Bot, Dispatcher, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from aiogram.filters import Command, or_f
+from aiogram.filters import Command, CommandObject
 from aiogram.utils.chat_action import ChatActionSender
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 
+from admin_digest import admin_digest
+from broadcasts import broadcast_engine
+from callbacks import QUIZ_ANSWER, QUIZ_CATEGORY, CallbackActions, pack
+from database import Database, db, on_startup, on_shutdown
+from fsm_storage import FSMFlushMiddleware, fsm_storage
+from known_users import known_users
+from keyboards import (
+    AIR_QUALITY, BACK_TO_MAIN_MENU, CLIMATE, ECO_CATEGORIES, ECO_INTRO, MAIN_MENU_KB, MAIN_MENU_PROMPT,
+    MAP_MENU_BACK, MOSCOW_CLIMATE, SATELLITE_INFO_KB, SATELLITES_MAP, SPACE_MAP,
+    WELCOME, WILDFIRES, Screen
+)
+from leaderboard import leaderboard
+from media_cache import media_cache
+from migrations import migrate
+from news_feed import news_feed
+from outbound import outbound_limiter
+from points import points_buffer
+from progress import progress_store
+from quest_engine import quest_engine
+from roles import role_cache
+from scheduler import update_scheduler
+from submissions import submission_writer
+from text_routes import TextRoutes, warn_conflicts
+from webhook import BOT_RUN_MODE, run_webhook
 from routers.quest_router import quest_router
 
-dp = Dispatcher()
+# Состояния FSM переживают перезапуск: хранятся в PostgreSQL с LRU-кэшем в памяти
+dp = Dispatcher(storage=fsm_storage)
+# Апдейты разных чатов идут параллельно, одного чата — строго по очереди.
+# Планировщик стоит перед FSMContextMiddleware: состояние читается уже внутри
+# очереди чата и видит изменения предыдущего апдейта, а сброс FSM идет после них
+update_scheduler.attach(dp)
+dp.update.outer_middleware(FSMFlushMiddleware(fsm_storage))
+# Кнопки меню разбираются одним поиском по (состоянию, тексту) раньше остальных хендлеров
+menu = TextRoutes(dp)
+# Callback-кнопки: данные декодируются один раз и ищутся в таблице действий
+actions = CallbackActions(dp, reject_unknown=True)
 bot = Bot(token=os.getenv("BOT_TOKEN"))
+# Все исходящие запросы проходят через общий ограничитель частоты
+bot.session.middleware(outbound_limiter)
 dp.include_router(quest_router)
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Данные подключения к PostgreSQL
-POSTGRES_URI = os.getenv("POSTGRESURL")
-DB_USER = os.getenv("DATABASE_USER")
-DB_PASSWORD = os.getenv("DATABASE_PASSWORD")
-
 # Инициализация бота
 
 class SurveyStates(StatesGroup):
     QUESTION = State()
 
-
-async def get_db():
-    try:
-        conn = await asyncpg.connect(
-            dsn=POSTGRES_URI,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            timeout=10  # Установите таймаут 10 секунд
-        )
-        print("Успешное подключение к PostgreSQL!")
-        return conn
-    except Exception as e:
-        logger.error(f"Ошибка подключения: {e}")
-        raise
-
-# Создаем клавиатуру главного меню
-def main_menu_kb():
-    builder = ReplyKeyboardBuilder()
-    buttons = [
-        "🛰 Космическая карта",
-        "🌍 Экологические данные",
-        "📰 Новости",
-        "🗺️ Квест-трип по городу",
-        "🎓 Викторина о космосе",
-        "🏅 Профиль"
-    ]
-    for btn in buttons:
-        builder.add(types.KeyboardButton(text=btn))
-    builder.adjust(2, 2, 2)
-    return builder.as_markup(resize_keyboard=True)
-
-
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     username = message.from_user.username or ""
 
-    conn = await get_db()
-    try:
-        await conn.execute(
-            "INSERT INTO users (id, username) VALUES ($1, $2) "
-            "ON CONFLICT (id) DO NOTHING",
-            user_id, username
-        )
-    finally:
-        await conn.close()
-
-    welcome_text = (
-        "🚀 Привет, космический путешественник! 🚀\n\n"
-        "Добро пожаловать в чат-бот SR space, твой личный космический центр управления!\n\n"
-        "Меня зовут Спэйси! От лица всей команды рад приветствовать! Я здесь, чтобы сделать космос ближе для тебя.\n"
-        "🔹 /map — Космическая карта спутников 🛰\n"
-        "🔹 /news — Свежие новости о космосе 📰\n"
-        "🔹 /eco — Данные о загрязнении и климате 🌍\n"
-        "🔹 /quest — Космический квест-трип по твоему городу 🗺️\n"
-        "🔹 /quiz — Викторина о космосе 🎓\n"
-        "🔹 /profile — Твой личный профиль 🏅"
-    )
+    # Вернувшиеся пользователи не трогают БД, новые записываются пакетом
+    if known_users.register(user_id, username):
+        leaderboard.add_user(user_id, username)
 
-    await message.answer(welcome_text)
-    await message.answer(
-        "Выбери команду или нажми на кнопку ниже ⬇️",
-        reply_markup=main_menu_kb()
-    )
+    await WELCOME.answer(message)
+    await MAIN_MENU_PROMPT.answer(message)
     await state.clear()
 
 
-@dp.message(or_f(F.text == "🏅 Профиль", Command("profile")))
+@menu("🏅 Профиль")
+@dp.message(Command("profile"))
 async def show_profile(message: types.Message):
     await show_user_profile(message.from_user.id, message)
 
 
 async def show_user_profile(user_id: int, message: types.Message):
-    async with ChatActionSender.typing(
-            chat_id=message.chat.id,
-            bot=message.bot
-    ):
-        conn = await get_db()
     try:
-        user = await conn.fetchrow(
-            "SELECT username, points FROM users WHERE id = $1",
-            user_id
-        )
+        async with ChatActionSender.typing(
+                chat_id=message.chat.id,
+                bot=message.bot
+        ), db.acquire() as conn:
+            user = await conn.fetchrow(
+                "SELECT username, points FROM users WHERE id = $1",
+                user_id
+            )
     except Exception as e:
         logger.error(f"Database error: {e}")
         await message.answer("Ошибка при получении профиля")
         return
-    finally:
-        await conn.close()
 
     if not user:
         await message.answer("Профиль не найден!")
         return
 
+    # Учитываем баллы, которые еще не записаны в БД
+    points = user['points'] + points_buffer.pending(user_id)
+
     # Создаем клавиатуру профиля
     builder = InlineKeyboardBuilder()
     builder.button(text="🏆 Топ-5 рейтинг", callback_data="show_rating")
@@ -132,36 +108,31 @@ async def show_user_profile(user_id: int, message: types.Message):
     profile_text = (
         f"👤 Ваш профиль:\n"
         f"▫️ Имя: {user['username'] or 'гость'}\n"
-        f"▫️ Баллы: {user['points']}"
+        f"▫️ Баллы: {points}"
     )
 
+    place = leaderboard.rank(user_id)
+    if place:
+        profile_text += f"\n▫️ Место в рейтинге: #{place[0]} из {place[1]}"
+
     await message.answer(
         profile_text,
         reply_markup=builder.as_markup()
     )
 
-@dp.callback_query(F.data == "show_rating")
+@actions("show_rating")
 async def show_rating(callback: types.CallbackQuery):
-    try:
-        conn = await get_db()
-        top_users = await conn.fetch(
-            "SELECT username, points FROM users ORDER BY points DESC LIMIT 5"
-        )
-    except Exception as e:
-        logger.error(f"Rating error: {e}")
-        await callback.answer("⚠️ Ошибка загрузки рейтинга")
-        return
-    finally:
-        await conn.close()
+    # Рейтинг поддерживается в памяти, запрос к БД не нужен
+    top_users = leaderboard.top(5)
 
     if not top_users:
         await callback.message.answer("🏆 Рейтинг пока пуст!")
         return
 
     rating_text = "🏆 Топ-5 пользователей:\n\n"
-    for i, user in enumerate(top_users, 1):
-        username = user['username'] or "Аноним"
-        rating_text += f"{i}. {username} - ⭐ {user['points']} баллов\n"
+    for i, (username, points) in enumerate(top_users, 1):
+        username = username or "Аноним"
+        rating_text += f"{i}. {username} - ⭐ {points} баллов\n"
 
     # Добавляем отправку сообщения
     await callback.message.answer(rating_text)
@@ -174,179 +145,40 @@ class EcoState(StatesGroup):
     CLIMATE = State()
     MOSCOW_CLIMATE = State()
 
-# Клавиатура для изменения климата
-def climate_keyboard():
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        types.InlineKeyboardButton(
-            text="Глобальная карта климата",
-            url="https://map.srcms.space/"
-        ),
-        types.InlineKeyboardButton(
-            text="Климат в Москве",
-            callback_data="climate_moscow"
-        )
-    )
-    builder.row(
-        types.InlineKeyboardButton(
-            text="⬅️ Назад",
-            callback_data="eco_back"
-        )
-    )
-    return builder.as_markup()
-
-# Клавиатура для качества воздуха
-def air_quality_keyboard():
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        types.InlineKeyboardButton(
-            text="Глобальная карта AQI",
-            url="https://www.iqair.com/ru/earth?nav="
-        )
-    )
-    builder.row(
-        types.InlineKeyboardButton(
-            text="⬅️ Назад",
-            callback_data="eco_back"
-        )
-    )
-    return builder.as_markup()
-
-# Клавиатура для лесных пожаров
-def wildfires_keyboard():
-    builder = InlineKeyboardBuilder()
-    builder.row(
-        types.InlineKeyboardButton(
-            text="Карта лесных пожаров",
-            url="https://firms.modaps.eosdis.nasa.gov/map/#d:24hrs;@97.1,33.5,3.0z"
-        )
-    )
-    builder.row(
-        types.InlineKeyboardButton(
-            text="⬅️ Назад",
-            callback_data="eco_back"
-        )
-    )
-    return builder.as_markup()
-
-def eco_categories_kb():
-    builder = ReplyKeyboardBuilder()
-    buttons = [
-        "Лесные пожары",
-        "Загрязнение воздуха",
-        "Изменение климата",
-        "Назад в главное меню"
-    ]
-    for btn in buttons:
-        builder.add(types.KeyboardButton(text=btn))
-    builder.adjust(1, 1, 1, 1)  # По одной кнопке в ряду
-    return builder.as_markup(resize_keyboard=True, one_time_keyboard=True)
-
 # Обработчик для кнопки "Экологические данные"
-@dp.message(F.text == "🌍 Экологические данные")
+@menu("🌍 Экологические данные")
 async def handle_eco_data(message: types.Message, state: FSMContext):
     await state.set_state(EcoState.MAIN_MENU)
-    await message.answer(
-        "🌍 Экологический мониторинг\n\n"
-        "Я могу показать данные о состоянии окружающей среды в реальном времени! Выберите, что вас интересует:"
-    )
-    await message.answer("Выберите категорию ниже:", reply_markup=eco_categories_kb())
-
-# Клавиатура для лесных пожаров
-def wildfires_kb():
-    builder = ReplyKeyboardBuilder()
-    builder.add(types.KeyboardButton(text="Карта лесных пожаров", url="https://fires.ru"))
-    builder.add(types.KeyboardButton(text="⬅️ Назад"))
-    builder.adjust(1, 1)
-    return builder.as_markup(resize_keyboard=True)
-
-# Клавиатура для загрязнения воздуха
-def air_pollution_kb():
-    builder = ReplyKeyboardBuilder()
-    builder.add(types.KeyboardButton(text="Глобальная карта AQI", url="https://aqicn.org/map/world"))
-    builder.add(types.KeyboardButton(text="⬅️ Назад"))
-    builder.adjust(1, 1)
-    return builder.as_markup(resize_keyboard=True)
-
-# Клавиатура для изменения климата
-def climate_change_kb():
-    builder = ReplyKeyboardBuilder()
-    builder.add(types.KeyboardButton(text="Глобальная карта климата", url="https://climate.nasa.gov"))
-    builder.add(types.KeyboardButton(text="Климат в Москве"))
-    builder.add(types.KeyboardButton(text="⬅️ Назад"))
-    builder.adjust(2, 1)
-    return builder.as_markup(resize_keyboard=True)
-
-# Клавиатура для климата Москвы
-def moscow_climate_kb():
-    builder = ReplyKeyboardBuilder()
-    builder.add(types.KeyboardButton(text="⬅️ Назад"))
-    return builder.as_markup(resize_keyboard=True)
+    await ECO_INTRO.answer(message)
+    await ECO_CATEGORIES.answer(message)
 
 # Обработчики
-@dp.message(F.text == "Лесные пожары")
+@menu("Лесные пожары")
 async def handle_wildfires(message: types.Message, state: FSMContext):
     await state.set_state(EcoState.WILDFIRES)
-    await message.answer(
-        "🔥 Мониторинг лесных пожаров\n\n"
-        "Актуальные данные о лесных пожарах:",
-        reply_markup=wildfires_keyboard()
-    )
+    await WILDFIRES.answer(message)
 
-@dp.message(F.text == "Загрязнение воздуха")
+@menu("Загрязнение воздуха")
 async def handle_air_pollution(message: types.Message, state: FSMContext):
     await state.set_state(EcoState.AIR_QUALITY)
-    await message.answer(
-        "🌫️ Качество воздуха\n\n"
-        "Я могу показать актуальную информацию о качестве воздуха:",
-        reply_markup=air_quality_keyboard()
-    )
+    await AIR_QUALITY.answer(message)
 
-@dp.message(F.text == "Изменение климата")
+@menu("Изменение климата")
 async def handle_climate(message: types.Message, state: FSMContext):
     await state.set_state(EcoState.CLIMATE)
-    await message.answer(
-        "🌡 Данные о климате\n\n"
-        "🌍 Я могу показать изменения температуры и климатические тренды:",
-        reply_markup=climate_keyboard()
-    )
+    await CLIMATE.answer(message)
 
-@dp.message(F.text == "Климат в Москве")
+@menu("Климат в Москве")
 async def handle_moscow_climate(message: types.Message, state: FSMContext):
     await state.set_state(EcoState.MOSCOW_CLIMATE)
-    response = (
-        "🌆 Климатические изменения в Москве\n\n"
-        "📅 Последние 5 лет:\n\n"
-        "🌡 Средняя температура:\n"
-        "2020: +7.3°C 🌡\n"
-        "2025: +8.1°C 📈\n"
-        "📊 Разница: +0.8°C\n\n"
-        "💧 Уровень осадков:\n"
-        "2020: 707 мм ☔\n"
-        "2025: 750 мм 📈\n"
-        "📊 Разница: +6%\n\n"
-        "🔥 Количество аномально жарких дней:\n"
-        "2020: 14 дней ☀️\n"
-        "2025: 23 дня 🔥\n"
-        "📊 Разница: +9 дней\n\n"
-        "🔗 Подробнее: https://climate.nasa.gov/"
-    )
-    await message.answer(response, reply_markup=moscow_climate_kb())
-
-BACK_ECO_DATA = "back_to_eco_main"
-
-def back_to_eco_kb() -> types.InlineKeyboardMarkup:
-    builder = InlineKeyboardBuilder()
-    builder.add(
-        types.InlineKeyboardButton(
-            text="⬅️ Назад",
-            callback_data=BACK_ECO_DATA
-        )
-    )
-    return builder.as_markup()
+    await MOSCOW_CLIMATE.answer(message)
 
+@actions("climate_moscow")
+async def handle_moscow_climate_button(callback: types.CallbackQuery, state: FSMContext):
+    await handle_moscow_climate(callback.message, state)
+    await callback.answer()
 
-@dp.callback_query(F.data == "eco_back")
+@actions("eco_back")
 async def handle_eco_back(callback: types.CallbackQuery, state: FSMContext):
     current_state = await state.get_state()
 
@@ -364,25 +196,19 @@ async def handle_eco_back(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 # Обработчик кнопки "Назад" для всех уровней
-@dp.message(F.text == "⬅️ Назад")
-async def handle_back(message: types.Message):
-    # Определяем предыдущее меню по контексту
-    if message.reply_markup == moscow_climate_kb():
-        await handle_climate_change(message)
+@menu("⬅️ Назад")
+async def handle_back(message: types.Message, state: FSMContext):
+    # Из климата Москвы возвращаемся к климату, отовсюду еще — к экологическому меню
+    if await state.get_state() == EcoState.MOSCOW_CLIMATE:
+        await handle_climate(message, state)
     else:
-        await handle_eco_data(message)
+        await handle_eco_data(message, state)
 
 @dp.message(SurveyStates.QUESTION)
 async def process_answer(message: types.Message, state: FSMContext):
-    user_id = message.from_user.id
-
-    async with await get_db() as conn:
-        await conn.execute(
-            "UPDATE users SET points = points + 1 WHERE id = $1",
-            user_id
-        )
+    points_buffer.add(message.from_user.id, 1)
 
-    await message.answer("Спасибо за ответ! Ваш балл добавлен.", reply_markup=main_menu_kb())
+    await message.answer("Спасибо за ответ! Ваш балл добавлен.", reply_markup=MAIN_MENU_KB)
     await state.clear()
 
 
@@ -440,16 +266,6 @@ def get_satellite_names():
 def find_satellite_by_name(name: str):
     return next((sat for sat in SATELLITES.values() if sat["name"] == name), None)
 
-# Клавиатура главного меню карты
-def map_menu_kb():
-    builder = ReplyKeyboardBuilder()
-    builder.add(types.KeyboardButton(text="Найти спутник"))
-    builder.add(types.KeyboardButton(text="Показать карту всех спутников"))
-    builder.add(types.KeyboardButton(text="Назад в главное меню"))
-    builder.adjust(2)
-    return builder.as_markup(resize_keyboard=True)
-
-
 def satellites_list_kb():
     builder = ReplyKeyboardBuilder()
     # Извлекаем только названия спутников
@@ -460,19 +276,22 @@ def satellites_list_kb():
     return builder.as_markup(resize_keyboard=True)
 
 
+SATELLITES_LIST = Screen("🔍 Выберите спутник из списка:", satellites_list_kb())
+SATELLITE_SCREENS = {
+    sat["name"]: Screen(f"🛰 {sat['name']}\n\n{sat['description']}", SATELLITE_INFO_KB)
+    for sat in SATELLITES.values()
+}
+
+
 # Обработчик кнопки "Космическая карта"
-@dp.message(F.text == "🛰 Космическая карта")
+@menu("🛰 Космическая карта")
 async def handle_space_map(message: types.Message, state: FSMContext):
     await state.set_state(MapStates.MAIN_MENU)
-    await message.answer(
-        "🌌 Добро пожаловать в раздел космической карты!\n"
-        "Здесь вы можете отслеживать спутники SR Space и другие объекты.",
-        reply_markup=map_menu_kb()
-    )
+    await SPACE_MAP.answer(message)
 
 
 # Обработчик кнопки "Найти спутник"
-@dp.message(F.text == "Найти спутник")
+@menu("Найти спутник")
 async def search_satellite(message: types.Message, state: FSMContext):
     current_state = await state.get_state()
     if current_state != MapStates.MAIN_MENU:
@@ -480,13 +299,10 @@ async def search_satellite(message: types.Message, state: FSMContext):
         return
 
     await state.set_state(MapStates.SATELLITE_LIST)
-    await message.answer(
-        "🔍 Выберите спутник из списка:",
-        reply_markup=satellites_list_kb()
-    )
+    await SATELLITES_LIST.answer(message)
 
 
-@dp.message(F.text.in_(get_satellite_names()), MapStates.SATELLITE_LIST)
+@menu(*get_satellite_names(), state=MapStates.SATELLITE_LIST)
 async def show_satellite_info(message: types.Message, state: FSMContext):
     satellite = find_satellite_by_name(message.text)
     if not satellite:
@@ -496,65 +312,32 @@ async def show_satellite_info(message: types.Message, state: FSMContext):
     await state.set_state(MapStates.SATELLITE_INFO)
     await state.update_data(current_satellite=satellite)
 
-    builder = ReplyKeyboardBuilder()
-    builder.add(types.KeyboardButton(text="Назад к списку"))
-
     # Отправляем только текст
-    await message.answer(
-        f"🛰 {satellite['name']}\n\n{satellite['description']}",
-        reply_markup=builder.as_markup(resize_keyboard=True)
-    )
+    await SATELLITE_SCREENS[satellite['name']].answer(message)
 
 
 # Обработчик кнопки "Назад"
-@dp.message(F.text == "Назад к списку", MapStates.SATELLITE_INFO)
+@menu("Назад к списку", state=MapStates.SATELLITE_INFO)
 async def back_to_list(message: types.Message, state: FSMContext):
     await state.set_state(MapStates.SATELLITE_LIST)
-    await message.answer(
-        "🔍 Выберите спутник из списка:",
-        reply_markup=satellites_list_kb()
-    )
+    await SATELLITES_LIST.answer(message)
 
 
 # Обработчик кнопки "Назад в главное меню"
-@dp.message(F.text == "Назад", MapStates.SATELLITE_LIST)
+@menu("Назад", state=MapStates.SATELLITE_LIST)
 async def back_to_map_menu(message: types.Message, state: FSMContext):
     await state.set_state(MapStates.MAIN_MENU)
-    await message.answer(
-        "Возвращаемся в меню карты:",
-        reply_markup=map_menu_kb()
-    )
+    await MAP_MENU_BACK.answer(message)
 
-@dp.message(F.text == "Показать карту всех спутников", MapStates.MAIN_MENU)
-async def handle_back_to_main_menu(message: types.Message, state: FSMContext):
+@menu("Показать карту всех спутников", state=MapStates.MAIN_MENU)
+async def show_satellites_map(message: types.Message, state: FSMContext):
     await state.set_state(MapStates.MAIN_MENU)
-    await message.answer(
-        "🛰 Глобальная карта спутников\n"
-        "\n"
-        "🔍 Здесь можно увидеть все активные спутники в реальном времени!\n"
-        "📡 Карта обновляется автоматически и показывает траектории движения.\n"
-        "\n"
-        "🔗https://spacegid.com/media/space_sattelite/",
-        reply_markup=main_menu_kb()
-    )
+    await SATELLITES_MAP.answer(message)
 
-@dp.message(F.text == "Назад в главное меню")
+@menu("Назад в главное меню")
 async def handle_back_to_main_menu(message: types.Message, state: FSMContext):
     await state.clear()
-    await message.answer(
-        "Вы вернулись в главное меню:",
-        reply_markup=main_menu_kb()
-    )
-
-# Обновляем старый обработчик для кнопки "Космическая карта"
-@dp.message(F.text.in_({"🛰 Космическая карта"}))
-async def handle_buttons(message: types.Message):
-    await handle_space_map(message, message.bot, message.chat.id)
-
-
-# ... предыдущий импорт ...
-from aiogram.types import URLInputFile
-
+    await BACK_TO_MAIN_MENU.answer(message)
 
 # Добавляем новые состояния
 class NewsStates(StatesGroup):
@@ -571,65 +354,47 @@ class AdminNewsStates(StatesGroup):
 
 # region News Section
 
-async def get_news_list():
-    conn = await get_db()
+@menu("📰 Новости")
+async def handle_news(message: types.Message, state: FSMContext):
     try:
-        return await conn.fetch("SELECT * FROM news ORDER BY created_at DESC")
+        async with ChatActionSender.typing(
+                chat_id=message.chat.id,
+                bot=message.bot
+        ):
+            news_item = await news_feed.get_after(None)
     except Exception as e:
         logger.error(f"Ошибка получения новостей: {e}")
-        return []
-    finally:
-        await conn.close()
-
-
-
-
-@dp.message(F.text == "📰 Новости")
-async def handle_news(message: types.Message, state: FSMContext):
-    async with ChatActionSender.typing(
-            chat_id=message.chat.id,
-            bot=message.bot
-    ):
-        news_list = await get_news_list()
-    if not news_list:
+        news_item = None
+    if not news_item:
         await message.answer("📭 Пока нет новостей. Следите за обновлениями!")
         return
 
     await state.set_state(NewsStates.VIEWING_NEWS)
-    await state.update_data(news_list=news_list, current_index=0)
-    await show_news(message.from_user.id, state)
+    await show_news(message.from_user.id, state, news_item)
 
 
-async def show_news(user_id: int, state: FSMContext):
-    data = await state.get_data()
-    news_list = data['news_list']
-    current_index = data['current_index']
-
+async def show_news(user_id: int, state: FSMContext, news_item: dict):
     try:
-        news_item = news_list[current_index]
-        text = f"📰 *{news_item['text']}\n\n*{news_item['created_at'].strftime('%d.%m.%Y')}"
-
-        builder = InlineKeyboardBuilder()
-        if current_index < len(news_list) - 1:
-            builder.button(text="◀️ Предыдущая", callback_data="prev_news")
-        builder.button(text="🏠 В меню", callback_data="news_back_to_menu")
-
-        send_method = bot.send_photo if news_item['photo'] else bot.send_message
-        content = {
-            'chat_id': user_id,
-            'caption' if news_item['photo'] else 'text': text,
-            'parse_mode': "Markdown",
-            'reply_markup': builder.as_markup()
-        }
-
+        # Текст и клавиатура уже отрисованы в кэше ленты
         if news_item['photo']:
-            if news_item['photo'].startswith(('http', 'https')):
-                content['photo'] = URLInputFile(news_item['photo'])
-            else:
-                content['photo'] = news_item['photo']
-
-        message = await send_method(**content)
-        await state.update_data(last_message_id=message.message_id)
+            # Картинка по URL загружается в Telegram один раз, дальше идет по file_id
+            message = await media_cache.send_photo(
+                bot,
+                news_item['photo'],
+                chat_id=user_id,
+                caption=news_item['text'],
+                parse_mode="Markdown",
+                reply_markup=news_item['reply_markup']
+            )
+        else:
+            message = await bot.send_message(
+                chat_id=user_id,
+                text=news_item['text'],
+                parse_mode="Markdown",
+                reply_markup=news_item['reply_markup']
+            )
+        # В состоянии храним только курсор текущей новости, а не всю ленту
+        await state.update_data(news_cursor=news_item['cursor'], last_message_id=message.message_id)
 
     except Exception as e:
         logger.error(f"News display error: {str(e)}")
@@ -639,12 +404,18 @@ async def show_news(user_id: int, state: FSMContext):
         )
 
 
-@dp.callback_query(NewsStates.VIEWING_NEWS, F.data == "prev_news")
+@actions("prev_news", state=NewsStates.VIEWING_NEWS)
 async def prev_news(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    current_index = data['current_index']
 
-    if current_index >= len(data['news_list']) - 1:
+    try:
+        news_item = await news_feed.get_after(data.get('news_cursor'))
+    except Exception as e:
+        logger.error(f"Ошибка получения новостей: {e}")
+        await callback.answer("⚠️ Не удалось загрузить новость")
+        return
+
+    if not news_item:
         await callback.answer("Это последняя новость")
         return
 
@@ -653,16 +424,15 @@ async def prev_news(callback: types.CallbackQuery, state: FSMContext):
     except TelegramBadRequest:
         pass
 
-    await state.update_data(current_index=current_index + 1)
-    await show_news(callback.from_user.id, state)
+    await show_news(callback.from_user.id, state, news_item)
     await callback.answer()
 
 
-@dp.callback_query(NewsStates.VIEWING_NEWS, F.data == "news_back_to_menu")
+@actions("news_back_to_menu", state=NewsStates.VIEWING_NEWS)
 async def news_back_to_menu(callback: types.CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.message.delete()
-    await callback.message.answer("Главное меню:", reply_markup=main_menu_kb())
+    await callback.message.answer("Главное меню:", reply_markup=MAIN_MENU_KB)
     await callback.answer()
 
 
@@ -671,15 +441,11 @@ async def news_back_to_menu(callback: types.CallbackQuery, state: FSMContext):
 # region Admin News Management
 
 async def is_admin(user_id: int):
-    conn = await get_db()
     try:
-        user = await conn.fetchrow("SELECT role FROM users WHERE id = $1", user_id)
-        return user and user['role'] == 'admin'
+        return await role_cache.is_admin(user_id)
     except Exception as e:
         logger.error(f"Ошибка проверки прав: {e}")
         return False
-    finally:
-        await conn.close()
 
 
 @dp.message(Command("add_news"))
@@ -740,106 +506,35 @@ async def request_confirmation(message: types.Message, state: FSMContext):
 
 # region Improved News Management
 
-async def send_news_to_user(user_id: int, news_item: asyncpg.Record):
-    max_retries = 5
-    backoff_factor = 0.5
-
-    for attempt in range(max_retries):
-        try:
-            text = f"📰 *{news_item['created_at'].strftime('%d.%m.%Y %H:%M')}*\n\n{news_item['text']}"
-
-            if news_item['photo']:
-                # Отправляем используя file_id напрямую
-                await bot.send_photo(
-                    chat_id=user_id,
-                    photo=news_item['photo'],
-                    caption=text,
-                    parse_mode="Markdown"
-                )
-            else:
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=text,
-                    parse_mode="Markdown"
-                )
-            return True
-
-        except TelegramAPIError as e:
-            wait_time = backoff_factor * (2 ** attempt)
-            logger.warning(f"Retry {attempt + 1}/{max_retries} for user {user_id} in {wait_time:.1f}s")
-            await asyncio.sleep(wait_time)
-
-        except Exception as e:
-            logger.error(f"Critical error for user {user_id}: {type(e).__name__} - {str(e)}")
-            return False
+from aiogram.exceptions import TelegramBadRequest
 
-    logger.error(f"Failed to send news to user {user_id} after {max_retries} attempts")
-    return False
 
-
-from aiogram.exceptions import TelegramBadRequest, TelegramAPIError
-
-
-@dp.callback_query(AdminNewsStates.CONFIRMATION, F.data == "confirm_news")
-async def confirm_news_publish(callback: types.CallbackQuery, state: FSMContext):
+@actions("confirm_news", state=AdminNewsStates.CONFIRMATION)
+async def confirm_news_publish(callback: types.CallbackQuery, state: FSMContext, db: Database):
     data = await state.get_data()
-    conn = await get_db()
 
     try:
         # Сохраняем новость с проверкой размера текста
         if len(data['text']) > 4000:
             raise ValueError("Text too long (max 4000 chars)")
 
-        news = await conn.fetchrow(
-            """INSERT INTO news (admin_id, text, photo)
-            VALUES ($1, $2, $3)
-            RETURNING *""",
-            callback.from_user.id,
-            data['text'][:4000],  # Обрезаем текст при необходимости
-            data.get('photo')[:512] if data.get('photo') else None  # Ограничение длины URL
-        )
-
-        # Асинхронная рассылка с ограничением параллелизма
-        users = await conn.fetch("SELECT id FROM users WHERE NOT is_banned")
-        semaphore = asyncio.Semaphore(10)  # Максимум 10 одновременных отправок
-
-        async def send_task(user):
-            async with semaphore:
-                return await send_news_to_user(user['id'], news)
-
-        results = await asyncio.gather(*[send_task(user) for user in users])
-
-        success_count = sum(results)
-        failed_count = len(results) - success_count
+        # Соединение берется только на время запросов, а не на всю рассылку
+        async with db.acquire() as conn:
+            news = await conn.fetchrow(
+                """INSERT INTO news (admin_id, text, photo)
+                VALUES ($1, $2, $3)
+                RETURNING *""",
+                callback.from_user.id,
+                data['text'][:4000],  # Обрезаем текст при необходимости
+                data.get('photo')[:512] if data.get('photo') else None  # Ограничение длины URL
+            )
 
-        status_message = (
-            f"📊 Статус рассылки:\n"
-            f"• Успешно: {success_count}\n"
-            f"• Не доставлено: {failed_count}\n"
-            f"• Всего получателей: {len(users)}"
-        )
+        # Новость сразу попадает в кэш ленты
+        news_feed.publish(news)
 
-        # Отправка отчета администратору
-        report_text = status_message + f"\n\nТекст новости:\n{data['text'][:300]}..."
-
-        try:
-            if data.get('photo'):
-                await callback.message.edit_caption(caption=report_text)
-            else:
-                await callback.message.edit_text(text=report_text)
-        except TelegramBadRequest as e:
-            if "message is not modified" in str(e):
-                pass
-            else:
-                raise
-
-        # Логирование в отдельную таблицу
-        await conn.execute(
-            """INSERT INTO news_delivery_logs 
-            (news_id, total_users, success_count) 
-            VALUES ($1, $2, $3)""",
-            news['id'], len(users), success_count
-        )
+        # Рассылка идет в фоне и переживает перезапуск; прогресс обновляется в этом же сообщении
+        await broadcast_engine.submit(news, callback.message.chat.id, callback.message.message_id)
+        await callback.answer("📤 Рассылка запущена")
 
     except ValueError as e:
         error_msg = f"❌ Ошибка: {str(e)}"
@@ -847,13 +542,25 @@ async def confirm_news_publish(callback: types.CallbackQuery, state: FSMContext)
         error_msg = "⚠️ Ошибка публикации! Проверьте данные и подключение"
         logger.error(f"Publish error: {traceback.format_exc()}")
     finally:
-        await conn.close()
         await state.clear()
 
 
+@dp.message(Command("resumebroadcast"))
+async def resume_broadcast_command(message: types.Message, command: CommandObject):
+    if not await is_admin(message.from_user.id):
+        return await message.answer("⛔ Недостаточно прав!")
+
+    if not command.args or not command.args.strip().isdecimal():
+        return await message.answer("Использование: /resumebroadcast <номер рассылки>")
+    job_id = int(command.args.strip())
+    if not await broadcast_engine.resume(job_id):
+        return await message.answer(f"⚠️ Рассылка {job_id} не найдена или не прервана")
+    await message.answer(f"📤 Рассылка {job_id} продолжена")
+
+
 # endregion
 
-@dp.callback_query(AdminNewsStates.CONFIRMATION, F.data == "cancel_news")
+@actions("cancel_news", state=AdminNewsStates.CONFIRMATION)
 async def cancel_news_publish(callback: types.CallbackQuery, state: FSMContext):
     await state.clear()
     if callback.message.photo:
@@ -877,31 +584,24 @@ async def cancel_news_publish(callback: types.CallbackQuery, state: FSMContext):
 async def notify_admins(message: types.Message, state: FSMContext):
     data = await state.get_data()  # Теперь state передается как аргумент
 
-    conn = await get_db()
-    try:
-        admins = await conn.fetch(
-            "SELECT id FROM users WHERE role = 'admin'"
-        )
-
-        report_text = (
-            "🚨 Новое выполнение квеста!\n"
-            f"👤 Пользователь: @{message.from_user.username}\n"
-            f"🏙 Город: {data['city']}\n"  # Берем city из данных состояния
-            f"📷 Фото: {message.photo[-1].file_id}"
-        )
+    admins = await role_cache.admin_ids()
 
-        for admin in admins:
-            try:
-                await bot.send_photo(
-                    chat_id=admin['id'],
-                    photo=message.photo[-1].file_id,
-                    caption=report_text
-                )
-            except Exception as e:
-                logger.error(f"Error sending to admin {admin['id']}: {e}")
+    report_text = (
+        "🚨 Новое выполнение квеста!\n"
+        f"👤 Пользователь: @{message.from_user.username}\n"
+        f"🏙 Город: {data['city']}\n"  # Берем city из данных состояния
+        f"📷 Фото: {message.photo[-1].file_id}"
+    )
 
-    finally:
-        await conn.close()
+    for admin_id in admins:
+        try:
+            await bot.send_photo(
+                chat_id=admin_id,
+                photo=message.photo[-1].file_id,
+                caption=report_text
+            )
+        except Exception as e:
+            logger.error(f"Error sending to admin {admin_id}: {e}")
 
 
 quiz_categories = {
@@ -1018,7 +718,7 @@ quiz_categories = {
 }
 
 
-@dp.message(F.text == "🎓 Викторина о космосе")
+@menu("🎓 Викторина о космосе")
 async def start_quiz(message: types.Message, state: FSMContext):
     data = await state.get_data()
 
@@ -1048,18 +748,17 @@ async def show_category_selection(message: types.Message, state: FSMContext):
 
     builder = InlineKeyboardBuilder()
 
-    for category_id, category in quiz_categories.items():
+    for category_index, (category_id, category) in enumerate(quiz_categories.items()):
         is_used = category_id in used_categories
         is_completed = category_id in completed
         print(f"[DEBUG] Category {category_id} completed: {is_completed}")
 
-        safe_category_id = category_id.replace(" ", "_").lower()
-
         button_text = f"{'✅ ' if is_completed else ''}{category['title']}"
 
         builder.add(types.InlineKeyboardButton(
             text=button_text,
-            callback_data=f"cat_{safe_category_id}" if not is_used else "ignore", # Используем нормализованный ID
+            # Категория передается номером, а не названием — callback_data остается короткой
+            callback_data=pack(QUIZ_CATEGORY, category_index) if not is_used else "ignore",
             )
         )
 
@@ -1088,17 +787,22 @@ async def show_category_selection(message: types.Message, state: FSMContext):
         logger.error(f"Error showing categories: {str(e)}")
         await message.answer("⚠️ Ошибка при загрузке категорий")
 
-@dp.callback_query(F.data == "ignore")
+@actions("ignore")
 async def handle_ignore(callback: types.CallbackQuery):
     await callback.answer("🚫 Эта категория уже начата!", show_alert=True)
 
-@dp.callback_query(QuizStates.ANSWERING_QUESTION, F.data.startswith("ans_"))
-async def handle_answer(callback: types.CallbackQuery, state: FSMContext):
+@actions(QUIZ_ANSWER, arity=2, state=QuizStates.ANSWERING_QUESTION)
+async def handle_answer(callback: types.CallbackQuery, asked_index: int, selected_answer: int, state: FSMContext):
     try:
         data = await state.get_data()
         category_id = data['current_category']
         question_index = data['current_question_index']
 
+        # Кнопка от уже отвеченного вопроса
+        if asked_index != question_index:
+            await callback.answer("⚠️ Этот вопрос уже пройден")
+            return
+
         category = quiz_categories[category_id]
         questions = category["questions"]
         question = questions[question_index]
@@ -1110,19 +814,11 @@ async def handle_answer(callback: types.CallbackQuery, state: FSMContext):
             logger.error(f"Error removing buttons: {str(e)}")
 
         # Обработка ответа
-        selected_answer = int(callback.data.split("_")[1])
         is_correct = selected_answer == question["correct"]
 
         # Обновляем баллы
         if is_correct:
-            conn = await get_db()
-            try:
-                await conn.execute(
-                    "UPDATE users SET points = points + 1 WHERE id = $1",
-                    callback.from_user.id
-                )
-            finally:
-                await conn.close()
+            points_buffer.add(callback.from_user.id, 1)
 
         # Показываем результат
         explanation = (
@@ -1149,15 +845,12 @@ async def handle_answer(callback: types.CallbackQuery, state: FSMContext):
 
 
 async def get_user_points(user_id: int) -> int:
-    conn = await get_db()
-    try:
+    async with db.acquire() as conn:
         result = await conn.fetchval(
             "SELECT points FROM users WHERE id = $1",
             user_id
         )
-        return result or 0
-    finally:
-        await conn.close()
+    return (result or 0) + points_buffer.pending(user_id)
 
 
 async def complete_category(message: types.Message, state: FSMContext):
@@ -1177,14 +870,7 @@ async def complete_category(message: types.Message, state: FSMContext):
 
 @dp.message(Command("resetquiz"))
 async def resetquiz_command(message: types.Message):
-    # Получаем информацию о пользователе из БД
-    conn = await get_db()
-    user = await conn.fetchrow(
-        "SELECT role FROM users WHERE id = $1",
-        message.from_user.id
-    )
-
-    if not user or user['role'] != 'admin':
+    if not await is_admin(message.from_user.id):
         return await message.answer("⛔ Недостаточно прав!")
 
     await QuizManager.reset_all_progress()
@@ -1197,7 +883,7 @@ async def ask_first_question(message: types.Message, state: FSMContext):
     # Создаем клавиатуру для первого вопроса
     builder = InlineKeyboardBuilder()
     for i, option in enumerate(category["questions"][0]["options"]):
-        builder.button(text=option, callback_data=f"ans_{i}")
+        builder.button(text=option, callback_data=pack(QUIZ_ANSWER, 0, i))
 
     builder.adjust(1)
 
@@ -1231,7 +917,7 @@ async def ask_current_question(message: types.Message, state: FSMContext):
         # Создаем клавиатуру
         builder = InlineKeyboardBuilder()
         for i, option in enumerate(question["options"]):
-            builder.button(text=option, callback_data=f"ans_{i}")
+            builder.button(text=option, callback_data=pack(QUIZ_ANSWER, question_index, i))
         builder.adjust(1)
 
         # Отправляем вопрос
@@ -1251,12 +937,13 @@ async def ask_current_question(message: types.Message, state: FSMContext):
 
 
 # Добавляем обработчик для выбора категорий
-@dp.callback_query(F.data.startswith("cat_"))
-async def handle_category_selection(callback: types.CallbackQuery, state: FSMContext):
+@actions(QUIZ_CATEGORY, arity=1)
+async def handle_category_selection(callback: types.CallbackQuery, category_index: int, state: FSMContext):
     try:
-        # Получаем и декодируем category_id
-        encoded_category = callback.data.split("_", 1)[1]
-        category_id = urllib.parse.unquote_plus(encoded_category)
+        if category_index >= len(CATEGORY_IDS):
+            await callback.answer("⚠️ Категория не найдена")
+            return
+        category_id = CATEGORY_IDS[category_index]
         completed = await QuizManager.get_completed_categories(callback.from_user.id)
 
         data = await state.get_data()
@@ -1300,69 +987,145 @@ async def handle_category_selection(callback: types.CallbackQuery, state: FSMCon
         await callback.answer("⚠️ Ошибка при выборе категории")
 
 
+# Порядковый номер категории используется в callback_data
+CATEGORY_IDS = list(quiz_categories)
+# Каждой категории викторины соответствует свой бит в маске пройденных
+CATEGORY_BITS = {category_id: 1 << i for i, category_id in enumerate(quiz_categories)}
+COMPLETED_CACHE_SIZE = int(os.getenv("COMPLETED_CACHE_SIZE", "10000"))
+
+
 class QuizManager:
-    @staticmethod
-    async def get_completed_categories(user_id: int) -> set:
-        conn = await get_db()
-        result = await conn.fetch(
-            "SELECT category_id FROM completed_categories WHERE user_id = $1",
-            user_id
-        )
-        return {row['category_id'] for row in result}
+    # user_id -> битовая маска пройденных категорий (LRU)
+    _completed: OrderedDict[int, int] = OrderedDict()
 
     @staticmethod
-    async def complete_category(user_id: int, category_id: str):
-        conn = await get_db()
-        await conn.execute(
-            """INSERT INTO completed_categories (user_id, category_id)
-               VALUES ($1::BIGINT, $2::VARCHAR)
-               ON CONFLICT DO NOTHING""",
-            user_id, category_id
-        )
+    def _to_mask(category_ids) -> int:
+        mask = 0
+        for category_id in category_ids:
+            mask |= CATEGORY_BITS.get(category_id, 0)
+        return mask
+
+    @classmethod
+    def _remember(cls, user_id: int, mask: int):
+        cls._completed[user_id] = mask
+        cls._completed.move_to_end(user_id)
+        while len(cls._completed) > COMPLETED_CACHE_SIZE:
+            cls._completed.popitem(last=False)
+
+    @classmethod
+    async def get_completed_categories(cls, user_id: int) -> set:
+        mask = cls._completed.get(user_id)
+        if mask is None:
+            async with db.acquire() as conn:
+                result = await conn.fetch(
+                    "SELECT category_id FROM completed_categories WHERE user_id = $1",
+                    user_id
+                )
+            mask = cls._to_mask(row['category_id'] for row in result)
+        cls._remember(user_id, mask)
+        return {category_id for category_id, bit in CATEGORY_BITS.items() if mask & bit}
+
+    @classmethod
+    async def complete_category(cls, user_id: int, category_id: str):
+        async with db.acquire() as conn:
+            await conn.execute(
+                """INSERT INTO completed_categories (user_id, category_id)
+                   VALUES ($1::BIGINT, $2::VARCHAR)
+                   ON CONFLICT DO NOTHING""",
+                user_id, category_id
+            )
+        # Обновляем кэш только после успешной записи
+        if user_id in cls._completed:
+            cls._remember(user_id, cls._completed[user_id] | cls._to_mask([category_id]))
 
-    @staticmethod
-    async def reset_all_progress():
-        conn = await get_db()
-        await conn.execute("TRUNCATE TABLE completed_categories")
+    @classmethod
+    async def reset_all_progress(cls):
+        async with db.acquire() as conn:
+            await conn.execute("TRUNCATE TABLE completed_categories")
+        cls._completed.clear()
 
 # @dp.message()
 # async def unknown_message(message: types.Message):
 #     logger.warning(f"Unhandled message: {message.text}")
 #     await message.answer("Используйте кнопки меню для навигации")
 
-async def main():
-    bot = Bot(token=os.getenv("BOT_TOKEN"))
+@dp.message(Command("dbstats"))
+async def dbstats_command(message: types.Message, db: Database):
+    if not await is_admin(message.from_user.id):
+        return await message.answer("⛔ Недостаточно прав!")
 
-    conn = await get_db()
-    try:
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id BIGINT PRIMARY KEY,
-                username VARCHAR(255),
-                points INTEGER DEFAULT 0
-            )
-        ''')
-        # Создаем таблицу quest_submissions
-        await conn.execute('''
-                    CREATE TABLE IF NOT EXISTS quest_submissions (
-                        id SERIAL PRIMARY KEY,
-                        user_id BIGINT REFERENCES users(id),
-                        city TEXT,
-                        task_number INTEGER,
-                        photo_id TEXT,
-                        answer TEXT,
-                        submission_time TIMESTAMP
-                    )
-                ''')
-        # для учета пройденных категорий
-        await conn.execute('''CREATE TABLE IF NOT EXISTS completed_categories
-             (user_id INTEGER, 
-              category_id TEXT,
-              PRIMARY KEY (user_id, category_id))''')
-    finally:
-        await conn.close()
+    stats = db.stats()
+    submissions = submission_writer.stats()
+    fsm = fsm_storage.stats()
+    updates = update_scheduler.stats()
+    outbound = outbound_limiter.stats()
+    media = media_cache.stats()
+    digest = admin_digest.stats()
+    progress = progress_store.stats()
+    await message.answer(
+        "🗄 Пул соединений PostgreSQL:\n"
+        f"▫️ Соединений: {stats['size']} / {stats['max_size']} (свободно {stats['idle']})\n"
+        f"▫️ Выдано соединений: {stats['acquired']}\n"
+        f"▫️ Ожидание: среднее {stats['wait_avg_ms']:.1f} мс, макс. {stats['wait_max_ms']:.1f} мс\n"
+        f"🗺 Прогресс квеста: в кэше {progress['cached']}, не сохранено {progress['dirty']}, "
+        f"попаданий {progress['hits']}, промахов {progress['misses']}, записано {progress['written']}\n"
+        f"📥 Ответы квеста: в очереди {submissions['queued']}, "
+        f"задержка среднее {submissions['lag_avg_ms']:.1f} мс, макс. {submissions['lag_max_ms']:.1f} мс, "
+        f"записано {submissions['written']}, повторов {submissions['retried']}, "
+        f"в dead letters {submissions['dead']}, потеряно {submissions['failed']}, "
+        f"повторных фото {submissions['duplicates']} (отброшено {submissions['skipped']})\n"
+        f"💾 FSM: в кэше {fsm['cached']}, не сохранено {fsm['dirty']}, "
+        f"попаданий {fsm['hits']}, промахов {fsm['misses']}, "
+        f"удалено неактивных {fsm['evicted_keys']} ({fsm['reclaimed_bytes']} байт)\n"
+        f"📨 Апдейты: ждут {updates['waiting']} (макс. {updates['max_waiting']}), "
+        f"в работе {updates['running']}, чатов в очереди {updates['chats']}, "
+        f"обработано {updates['processed']}, отброшено {updates['shed']}\n"
+        f"📤 Исходящие: отправлено {outbound['sent']}, задержано лимитом {outbound['delayed']}, "
+        f"flood control {outbound['retry_after']}, чатов под лимитом {outbound['chats']}\n"
+        f"🖼 Медиа: file_id {media['files']}, повторных отправок {media['hits']}, "
+        f"загрузок {media['uploads']}, сэкономлено {media['bytes_saved'] // 1024} КБ\n"
+        f"📋 Отчеты админам: сразу {digest['sent_immediately']}, в дайджестах {digest['digested']}, "
+        f"ждут {digest['pending']}, сообщений {digest['messages']}"
+    )
+
+
+# Порядок важен: пул поднимается первым, а закрывается последним,
+# после того как фоновые буферы сбросят накопленное в БД
+dp.startup.register(warn_conflicts)
+dp.startup.register(quest_engine.start)
+dp.startup.register(on_startup)
+dp.startup.register(migrate)
+dp.startup.register(known_users.load)
+dp.startup.register(leaderboard.load)
+dp.startup.register(media_cache.load)
+dp.startup.register(role_cache.start)
+dp.startup.register(known_users.start)
+dp.startup.register(points_buffer.start)
+dp.startup.register(progress_store.start)
+dp.startup.register(submission_writer.start)
+dp.startup.register(fsm_storage.start)
+dp.startup.register(broadcast_engine.start)
+dp.startup.register(admin_digest.start)
+# Конвейер ответов дописывает очередь и отчеты раньше, чем останавливается дайджест
+dp.shutdown.register(submission_writer.stop)
+dp.shutdown.register(admin_digest.stop)
+dp.shutdown.register(broadcast_engine.stop)
+dp.shutdown.register(fsm_storage.stop)
+dp.shutdown.register(progress_store.stop)
+dp.shutdown.register(points_buffer.stop)
+dp.shutdown.register(known_users.stop)
+dp.shutdown.register(role_cache.stop)
+dp.shutdown.register(quest_engine.stop)
+dp.shutdown.register(on_shutdown)
 
-    await dp.start_polling(bot)
+
+async def main():
+    # Тот же экземпляр, что и в хендлерах: один сеанс и один ограничитель частоты
+    if BOT_RUN_MODE == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        # Лимит параллельности и отбрасывание при перегрузке — в update_scheduler
+        await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+import os
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputFile, Message, URLInputFile
+
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых file_id больше не годится и файл нужно загрузить заново.
+# Остальные (чат не найден, бот заблокирован, ошибка разметки подписи) к файлу не относятся
+FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference expired",
+    "file_reference_expired",
+)
+
+
+def _is_file_id_error(error: TelegramBadRequest) -> bool:
+    message = error.message.lower()
+    return any(text in message for text in FILE_ID_ERRORS)
+
+
+class MediaCache:
+    """file_id фотографий, которые бот уже загрузил в Telegram по URL или из файла.
+
+    Первая отправка загружает картинку, а file_id из ответа сохраняется в
+    media_files; все следующие отправки передают только file_id.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._files: dict[str, tuple[str, int]] = {}
+        # Один источник грузится один раз, даже если рассылка шлет его параллельно
+        self._uploading: dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.uploads = 0
+        self.bytes_saved = 0
+
+    async def load(self):
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch("SELECT source, file_id, file_size FROM media_files")
+        self._files = {row['source']: (row['file_id'], row['file_size']) for row in rows}
+        logger.info(f"Загружено {len(self._files)} file_id медиафайлов")
+
+    @staticmethod
+    def _input_file(source: str) -> InputFile | None:
+        if source.startswith(('http://', 'https://')):
+            return URLInputFile(source)
+        if os.path.isfile(source):
+            return FSInputFile(source)
+        # Все остальное уже является file_id
+        return None
+
+    async def _remember(self, source: str, message: Message):
+        photo = message.photo[-1]
+        size = photo.file_size or 0
+        if not size and os.path.isfile(source):
+            size = os.path.getsize(source)
+        self._files[source] = (photo.file_id, size)
+        self.uploads += 1
+        try:
+            async with self.db.acquire() as conn:
+                await conn.execute(
+                    """INSERT INTO media_files (source, file_id, file_size)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (source) DO UPDATE SET file_id = $2, file_size = $3, created_at = now()""",
+                    source, photo.file_id, size
+                )
+        except Exception as e:
+            # В памяти file_id уже есть, после рестарта картинка просто загрузится заново
+            logger.error(f"Не удалось сохранить file_id для {source}: {e}")
+
+    async def _send_cached(self, bot: Bot, source: str, **kwargs) -> Message | None:
+        cached = self._files.get(source)
+        if cached is None:
+            return None
+        file_id, size = cached
+        try:
+            message = await bot.send_photo(photo=file_id, **kwargs)
+        except TelegramBadRequest as e:
+            if not _is_file_id_error(e):
+                raise
+            # file_id стал недействительным — загрузим файл заново
+            logger.warning(f"file_id для {source} отклонен: {e}")
+            self._files.pop(source, None)
+            return None
+        self.hits += 1
+        self.bytes_saved += size
+        return message
+
+    async def send_photo(self, bot: Bot, photo: str, **kwargs) -> Message:
+        """bot.send_photo, который загружает URL или файл только при первой отправке"""
+        input_file = self._input_file(photo)
+        if input_file is None:
+            return await bot.send_photo(photo=photo, **kwargs)
+
+        if message := await self._send_cached(bot, photo, **kwargs):
+            return message
+
+        lock = self._uploading.setdefault(photo, asyncio.Lock())
+        try:
+            async with lock:
+                # Пока ждали, файл мог загрузить параллельный отправитель
+                if message := await self._send_cached(bot, photo, **kwargs):
+                    return message
+                message = await bot.send_photo(photo=input_file, **kwargs)
+                await self._remember(photo, message)
+                return message
+        finally:
+            if not lock.locked():
+                self._uploading.pop(photo, None)
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._files),
+            "hits": self.hits,
+            "uploads": self.uploads,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+media_cache = MediaCache(db=db)
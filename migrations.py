@@ -0,0 +1,197 @@
+import logging
+
+import asyncpg
+
+from database import db
+from roles import ROLE_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+# Произвольный ключ advisory-блокировки, чтобы миграции не шли в два потока
+MIGRATION_LOCK_ID = 7310001
+
+# Миграции применяются строго по возрастанию версии, каждая в своей транзакции.
+# Уже примененные шаги не меняются — для изменений добавляется новый шаг.
+MIGRATIONS = [
+    (1, "Базовые таблицы", '''
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGINT PRIMARY KEY,
+            username VARCHAR(255),
+            points INTEGER DEFAULT 0
+        );
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS role VARCHAR(32) DEFAULT 'user';
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS is_banned BOOLEAN DEFAULT FALSE;
+
+        CREATE TABLE IF NOT EXISTS quest_submissions (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT REFERENCES users(id),
+            city TEXT,
+            task_number INTEGER,
+            photo_id TEXT,
+            answer TEXT,
+            submission_time TIMESTAMP
+        );
+
+        -- для учета пройденных категорий
+        CREATE TABLE IF NOT EXISTS completed_categories (
+            user_id BIGINT,
+            category_id TEXT,
+            PRIMARY KEY (user_id, category_id)
+        );
+        -- id пользователей Telegram не помещаются в INTEGER
+        ALTER TABLE completed_categories ALTER COLUMN user_id TYPE BIGINT;
+    '''),
+    (2, "Новости и прогресс квеста", '''
+        CREATE TABLE IF NOT EXISTS news (
+            id SERIAL PRIMARY KEY,
+            admin_id BIGINT,
+            text TEXT NOT NULL,
+            photo VARCHAR(512),
+            created_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+
+        CREATE TABLE IF NOT EXISTS news_delivery_logs (
+            id SERIAL PRIMARY KEY,
+            news_id INTEGER REFERENCES news(id) ON DELETE CASCADE,
+            total_users INTEGER NOT NULL,
+            success_count INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id BIGINT PRIMARY KEY,
+            current_task INTEGER NOT NULL,
+            city TEXT
+        );
+    '''),
+    (3, "Уведомление о смене роли для кэша админов", f'''
+        CREATE OR REPLACE FUNCTION notify_role_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                IF OLD.role = 'admin' THEN
+                    PERFORM pg_notify('{ROLE_CHANNEL}', OLD.id::text);
+                END IF;
+                RETURN OLD;
+            END IF;
+            IF (TG_OP = 'INSERT' AND NEW.role = 'admin')
+               OR (TG_OP = 'UPDATE' AND NEW.role IS DISTINCT FROM OLD.role) THEN
+                PERFORM pg_notify('{ROLE_CHANNEL}', NEW.id::text);
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS users_role_notify ON users;
+        CREATE TRIGGER users_role_notify
+        AFTER INSERT OR DELETE OR UPDATE OF role ON users
+        FOR EACH ROW EXECUTE FUNCTION notify_role_change();
+    '''),
+    (4, "Индексы для частых запросов", '''
+        CREATE INDEX IF NOT EXISTS users_points_idx ON users (points DESC);
+        CREATE INDEX IF NOT EXISTS users_role_idx ON users (role);
+        CREATE INDEX IF NOT EXISTS quest_submissions_user_time_idx
+            ON quest_submissions (user_id, submission_time);
+        CREATE INDEX IF NOT EXISTS news_created_at_idx ON news (created_at);
+    '''),
+    (5, "Хранилище FSM", '''
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS fsm_storage_updated_at_idx ON fsm_storage (updated_at);
+    '''),
+    (6, "Задания рассылки новостей", '''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id SERIAL PRIMARY KEY,
+            news_id INTEGER NOT NULL REFERENCES news(id) ON DELETE CASCADE,
+            admin_chat_id BIGINT NOT NULL,
+            admin_message_id BIGINT NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'running',
+            -- id последнего обработанного получателя: рассылка идет по возрастанию id
+            last_user_id BIGINT NOT NULL DEFAULT 0,
+            total_users INTEGER NOT NULL DEFAULT 0,
+            success_count INTEGER NOT NULL DEFAULT 0,
+            failed_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            finished_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS broadcast_jobs_running_idx
+            ON broadcast_jobs (id) WHERE status = 'running';
+    '''),
+    (7, "Кэш загруженных медиафайлов", '''
+        CREATE TABLE IF NOT EXISTS media_files (
+            source VARCHAR(512) PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            file_size INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+    '''),
+    (8, "Ответы квеста, которые не удалось записать", '''
+        -- без внешних ключей: сюда попадают в том числе строки, нарушившие их
+        CREATE TABLE IF NOT EXISTS submission_dead_letters (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT,
+            city TEXT,
+            task_number INTEGER,
+            photo_id TEXT,
+            answer TEXT,
+            submission_time TIMESTAMP,
+            attempts INTEGER NOT NULL,
+            error TEXT NOT NULL,
+            failed_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+    '''),
+    (9, "Поиск повторно присланных фото квеста", '''
+        ALTER TABLE quest_submissions ADD COLUMN IF NOT EXISTS photo_unique_id TEXT;
+        ALTER TABLE submission_dead_letters ADD COLUMN IF NOT EXISTS photo_unique_id TEXT;
+        CREATE INDEX IF NOT EXISTS quest_submissions_photo_unique_idx
+            ON quest_submissions (photo_unique_id) WHERE photo_unique_id IS NOT NULL;
+    '''),
+    (10, "Индекс ленты новостей под keyset-пагинацию", '''
+        -- лента сортирует и сравнивает по (created_at, id): индекс только по created_at не покрывает id
+        CREATE INDEX IF NOT EXISTS news_created_at_id_idx ON news (created_at DESC, id DESC);
+        DROP INDEX IF EXISTS news_created_at_idx;
+    '''),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def _current_version(conn: asyncpg.Connection) -> int:
+    try:
+        return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    except asyncpg.UndefinedTableError:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        ''')
+        return 0
+
+
+async def migrate():
+    """Применяет только недостающие миграции; на прогретой базе — один запрос"""
+    async with db.acquire() as conn:
+        if await _current_version(conn) >= LATEST_VERSION:
+            return
+
+        await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+        try:
+            # Другой экземпляр мог применить миграции, пока мы ждали блокировку
+            version = await _current_version(conn)
+            for step, description, sql in MIGRATIONS:
+                if step <= version:
+                    continue
+                async with conn.transaction():
+                    await conn.execute(sql)
+                    await conn.execute(
+                        "INSERT INTO schema_version (version, description) VALUES ($1, $2)",
+                        step, description
+                    )
+                logger.info(f"Применена миграция {step}: {description}")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
@@ -0,0 +1,148 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+import asyncpg
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+# Сколько свежих новостей держать в памяти уже отрисованными
+NEWS_CACHE_SIZE = int(os.getenv("NEWS_CACHE_SIZE", "50"))
+# Сколько предзагруженных страниц ленты (старше кэша) держать в памяти
+NEWS_PREFETCH_LIMIT = int(os.getenv("NEWS_PREFETCH_LIMIT", "64"))
+
+
+def _news_markup(has_older: bool):
+    builder = InlineKeyboardBuilder()
+    if has_older:
+        builder.button(text="◀️ Предыдущая", callback_data="prev_news")
+    builder.button(text="🏠 В меню", callback_data="news_back_to_menu")
+    return builder.as_markup()
+
+
+# Разметка зависит только от наличия более старых новостей — строим один раз
+NEWS_MARKUP_WITH_OLDER = _news_markup(has_older=True)
+NEWS_MARKUP_LAST = _news_markup(has_older=False)
+
+
+def news_cursor(news_item: asyncpg.Record) -> list:
+    """Курсор ленты для FSM: [created_at в ISO, id] — сериализуется в JSON"""
+    return [news_item['created_at'].isoformat(), news_item['id']]
+
+
+def render_news(news_item: asyncpg.Record, has_older: bool) -> dict:
+    return {
+        'id': news_item['id'],
+        'cursor': news_cursor(news_item),
+        'text': f"📰 *{news_item['text']}\n\n*{news_item['created_at'].strftime('%d.%m.%Y')}",
+        'photo': news_item['photo'],
+        'reply_markup': NEWS_MARKUP_WITH_OLDER if has_older else NEWS_MARKUP_LAST,
+        'has_older': has_older,
+    }
+
+
+class NewsFeed:
+    """Лента новостей: свежие новости из памяти, более старые — keyset-пагинацией по (created_at, id)"""
+
+    def __init__(self, db: Database, cache_size: int, prefetch_limit: int):
+        self.db = db
+        self.cache_size = cache_size
+        self.prefetch_limit = prefetch_limit
+        # Отрисованные свежие новости, от новых к старым; None — еще не загружены
+        self._recent: list[dict] | None = None
+        self._recent_index: dict[tuple, int] = {}
+        self._load_lock = asyncio.Lock()
+        # Курсор -> задача загрузки новости после курсора (для хвоста ленты)
+        self._pages: OrderedDict[tuple, asyncio.Task] = OrderedDict()
+
+    async def _load_recent(self) -> list[dict]:
+        async with self._load_lock:
+            if self._recent is not None:
+                return self._recent
+            async with self.db.acquire() as conn:
+                rows = await conn.fetch(
+                    "SELECT * FROM news ORDER BY created_at DESC, id DESC LIMIT $1",
+                    self.cache_size + 1
+                )
+            # Лишняя строка нужна только чтобы понять, есть ли новости старше кэша
+            recent = [
+                render_news(row, has_older=i + 1 < len(rows))
+                for i, row in enumerate(rows[:self.cache_size])
+            ]
+            self._set_recent(recent)
+            return recent
+
+    def _set_recent(self, recent: list[dict]):
+        self._recent = recent
+        self._recent_index = {tuple(item['cursor']): i for i, item in enumerate(recent)}
+
+    async def _fetch(self, cursor: tuple) -> dict | None:
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch(
+                """SELECT * FROM news WHERE (created_at, id) < ($1, $2)
+                ORDER BY created_at DESC, id DESC LIMIT 2""",
+                datetime.fromisoformat(cursor[0]), cursor[1]
+            )
+        # Вторая строка нужна только чтобы понять, есть ли новости старше
+        return render_news(rows[0], has_older=len(rows) > 1) if rows else None
+
+    def _page(self, cursor: tuple) -> asyncio.Task:
+        task = self._pages.get(cursor)
+        if task is not None and not (task.done() and task.exception()):
+            self._pages.move_to_end(cursor)
+            return task
+
+        task = asyncio.create_task(self._fetch(cursor))
+        task.add_done_callback(self._log_failure)
+        self._pages[cursor] = task
+        while len(self._pages) > self.prefetch_limit:
+            self._pages.popitem(last=False)
+        return task
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Ошибка загрузки новостей: {task.exception()}")
+
+    async def get_after(self, cursor: list | None) -> dict | None:
+        """Отрисованная новость сразу после курсора (None — самая свежая)"""
+        recent = self._recent
+        if recent is None:
+            recent = await self._load_recent()
+
+        if cursor is None:
+            return recent[0] if recent else None
+
+        key = tuple(cursor)
+        index = self._recent_index.get(key)
+        if index is not None and index + 1 < len(recent):
+            return recent[index + 1]
+
+        # Курсор за пределами кэша — идем в БД и заранее грузим следующую новость
+        news_item = await self._page(key)
+        if news_item and news_item['has_older']:
+            self._page(tuple(news_item['cursor']))
+        return news_item
+
+    def publish(self, news_item: asyncpg.Record):
+        """Добавляет опубликованную новость в начало кэша без обращения к БД"""
+        if self._recent is None:
+            return
+        recent = [render_news(news_item, has_older=bool(self._recent))] + self._recent
+        if len(recent) > self.cache_size:
+            recent = recent[:self.cache_size]
+            recent[-1] = {**recent[-1], 'reply_markup': NEWS_MARKUP_WITH_OLDER, 'has_older': True}
+        self._set_recent(recent)
+
+    def invalidate(self):
+        self._recent = None
+        self._recent_index = {}
+        self._pages.clear()
+
+
+news_feed = NewsFeed(db=db, cache_size=NEWS_CACHE_SIZE, prefetch_limit=NEWS_PREFETCH_LIMIT)
@@ -0,0 +1,196 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота, 1 в секунду в чат, 20 в минуту в группу
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_GROUP_PER_MINUTE = float(os.getenv("OUTBOUND_GROUP_PER_MINUTE", "20"))
+# Сколько глобальных токенов рассылка оставляет интерактивным ответам
+OUTBOUND_BULK_RESERVE = int(os.getenv("OUTBOUND_BULK_RESERVE", "5"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+# Лимитируются только методы, которые отправляют или меняют сообщения в чате
+LIMITED_PREFIXES = ("send", "copy", "forward", "edit")
+UNLIMITED_METHODS = {"sendChatAction"}
+
+# Фоновые отправки (рассылки) помечаются через contextvar и уступают интерактивным
+_bulk: ContextVar[bool] = ContextVar("outbound_bulk", default=False)
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Забирает токен (можно в долг) и возвращает, сколько ждать до его выдачи"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def take(self, keep: float = 0) -> float:
+        """Забирает токен, если после этого останется не меньше `keep`; иначе — сколько ждать"""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= keep + 1:
+            self.tokens -= 1
+            return 0.0
+        return (keep + 1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        """Следующий токен будет выдан не раньше чем через `seconds`"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self) -> bool:
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """Ограничитель исходящих запросов к Bot API, подключается к сессии бота.
+
+    Глобальный бакет общий для всех чатов; у каждого чата свой бакет. Рассылки
+    (внутри `bulk()`) берут глобальный токен, только если остается резерв
+    и никто из интерактивных ответов не ждет.
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        group_per_minute: float,
+        bulk_reserve: int,
+        max_retries: int
+    ):
+        self.chat_rate = chat_rate
+        self.group_rate = group_per_minute / 60
+        self.bulk_reserve = bulk_reserve
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: OrderedDict[int | str, TokenBucket] = OrderedDict()
+        self._interactive_waiting = 0
+        self.sent = 0
+        self.delayed = 0
+        self.retry_after = 0
+
+    @staticmethod
+    @contextmanager
+    def bulk():
+        """Помечает отправки внутри блока (и созданных в нем задач) как фоновые"""
+        token = _bulk.set(True)
+        try:
+            yield
+        finally:
+            _bulk.reset(token)
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Отрицательный id или @username — группа или канал
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            # Небольшой запас, чтобы ответ и следующее за ним сообщение не ждали
+            bucket = self._chats[chat_id] = TokenBucket(rate, 3)
+        else:
+            self._chats.move_to_end(chat_id)
+
+        # Давно неактивные бакеты полны, хранить их незачем
+        while len(self._chats) > 1 and next(iter(self._chats.values())).is_full():
+            self._chats.popitem(last=False)
+        return bucket
+
+    async def _acquire_global(self, bulk: bool):
+        if bulk:
+            while True:
+                wait = 0.05 if self._interactive_waiting else self._global.take(self.bulk_reserve)
+                if not wait:
+                    return
+                await asyncio.sleep(wait)
+
+        self._interactive_waiting += 1
+        try:
+            while wait := self._global.take():
+                await asyncio.sleep(wait)
+        finally:
+            self._interactive_waiting -= 1
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        if api_method in UNLIMITED_METHODS or not api_method.startswith(LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+        bulk = _bulk.get()
+
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            if bucket is not None:
+                if wait := bucket.reserve():
+                    await asyncio.sleep(wait)
+            await self._acquire_global(bulk)
+            if time.monotonic() - started > 0.001:
+                self.delayed += 1
+
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after += 1
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"{api_method} в чат {chat_id}: flood control, ждем {e.retry_after} с")
+                # Telegram сам говорит, сколько ждать, — повтор не раньше этого срока
+                if bucket is not None:
+                    bucket.pause(e.retry_after)
+                else:
+                    self._global.pause(e.retry_after)
+                continue
+
+            self.sent += 1
+            return response
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "delayed": self.delayed,
+            "retry_after": self.retry_after,
+            "chats": len(self._chats),
+            "interactive_waiting": self._interactive_waiting,
+        }
+
+
+outbound_limiter = OutboundLimiter(
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    chat_rate=OUTBOUND_CHAT_RATE,
+    group_per_minute=OUTBOUND_GROUP_PER_MINUTE,
+    bulk_reserve=OUTBOUND_BULK_RESERVE,
+    max_retries=OUTBOUND_MAX_RETRIES
+)
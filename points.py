@@ -0,0 +1,69 @@
+import os
+import asyncio
+import logging
+
+from database import Database, db
+from known_users import known_users
+from leaderboard import leaderboard
+from write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+# Как часто и при каком числе пользователей сбрасывать накопленные баллы
+POINTS_FLUSH_INTERVAL = float(os.getenv("POINTS_FLUSH_INTERVAL", "2"))
+POINTS_FLUSH_SIZE = int(os.getenv("POINTS_FLUSH_SIZE", "500"))
+
+
+class PointsBuffer(WriteBehindBuffer):
+    """Накопитель начислений баллов с отложенной пакетной записью в users"""
+
+    def __init__(self, db: Database, flush_interval: float, flush_size: int):
+        super().__init__(flush_interval)
+        self.db = db
+        self.flush_size = flush_size
+        self._pending: dict[int, int] = {}
+        # Пакет, который пишется сейчас: до коммита его еще нет в БД
+        self._inflight: dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, user_id: int, delta: int):
+        """Начисляет баллы без обращения к БД"""
+        self._pending[user_id] = self._pending.get(user_id, 0) + delta
+        leaderboard.add_points(user_id, delta)
+        if len(self._pending) >= self.flush_size:
+            self.wake()
+
+    def pending(self, user_id: int) -> int:
+        """Баллы пользователя, еще не записанные в БД"""
+        return self._pending.get(user_id, 0) + self._inflight.get(user_id, 0)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            # Новые пользователи должны попасть в users раньше своих баллов
+            await known_users.flush()
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+            try:
+                async with self.db.acquire() as conn:
+                    await conn.execute(
+                        """UPDATE users AS u SET points = u.points + v.delta
+                        FROM unnest($1::bigint[], $2::int[]) AS v(id, delta)
+                        WHERE u.id = v.id""",
+                        list(batch.keys()), list(batch.values())
+                    )
+            except Exception as e:
+                # Возвращаем начисления обратно, чтобы не потерять их
+                for user_id, delta in batch.items():
+                    self._pending[user_id] = self._pending.get(user_id, 0) + delta
+                logger.error(f"Ошибка записи баллов ({len(batch)} польз.): {e}")
+            finally:
+                self._inflight = {}
+
+
+points_buffer = PointsBuffer(
+    db=db,
+    flush_interval=POINTS_FLUSH_INTERVAL,
+    flush_size=POINTS_FLUSH_SIZE
+)
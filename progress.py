@@ -0,0 +1,135 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+
+from database import Database, db
+from write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+# Прогресс в БД отстает от памяти не больше чем на PROGRESS_FLUSH_INTERVAL секунд
+PROGRESS_FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "5"))
+PROGRESS_FLUSH_SIZE = int(os.getenv("PROGRESS_FLUSH_SIZE", "500"))
+# Сколько пользователей держать в кэше прочитанного прогресса
+PROGRESS_CACHE_SIZE = int(os.getenv("PROGRESS_CACHE_SIZE", "10000"))
+
+_MISSING = object()
+
+
+class ProgressStore(WriteBehindBuffer):
+    """Прогресс квеста в памяти с пакетной записью изменений в user_progress.
+
+    Изменения копятся в `_dirty` (None — удаление) и пишутся одним UPSERT и
+    одним DELETE в транзакции раз в flush_interval или при flush_size
+    изменений. Выход из квеста и остановка бота сбрасывают их сразу.
+    """
+
+    def __init__(self, db: Database, flush_interval: float, flush_size: int, cache_size: int):
+        super().__init__(flush_interval)
+        self.db = db
+        self.flush_size = flush_size
+        self.cache_size = cache_size
+        # LRU прочитанного и записанного прогресса: user_id -> (задание, город) или None
+        self._cache: OrderedDict[int, tuple[int, str] | None] = OrderedDict()
+        # Еще не записанные изменения; из кэша могут вытесняться, отсюда — нет
+        self._dirty: dict[int, tuple[int, str] | None] = {}
+        self._flush_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.written = 0
+
+    def _remember(self, user_id: int, value: tuple[int, str] | None):
+        self._cache[user_id] = value
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, user_id: int) -> dict | None:
+        """{'current_task', 'city'} или None, если сохраненного прогресса нет"""
+        if user_id in self._dirty:
+            value = self._dirty[user_id]
+            self.hits += 1
+        else:
+            value = self._cache.get(user_id, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                async with self.db.acquire() as conn:
+                    row = await conn.fetchrow(
+                        "SELECT current_task, city FROM user_progress WHERE user_id = $1",
+                        user_id
+                    )
+                value = (row['current_task'], row['city']) if row else None
+                # Пока шел запрос, прогресс мог измениться — свежее значение важнее
+                if user_id in self._dirty:
+                    value = self._dirty[user_id]
+                else:
+                    self._remember(user_id, value)
+            else:
+                self.hits += 1
+                self._cache.move_to_end(user_id)
+        if value is None:
+            return None
+        return {'current_task': value[0], 'city': value[1]}
+
+    def _mark(self, user_id: int, value: tuple[int, str] | None):
+        self._dirty[user_id] = value
+        self._remember(user_id, value)
+        if len(self._dirty) >= self.flush_size:
+            self.wake()
+
+    def set(self, user_id: int, current_task: int, city: str):
+        """Запоминает прогресс без обращения к БД"""
+        self._mark(user_id, (current_task, city))
+
+    def delete(self, user_id: int):
+        self._mark(user_id, None)
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            upserts = {user_id: value for user_id, value in batch.items() if value is not None}
+            deletes = [user_id for user_id, value in batch.items() if value is None]
+            try:
+                async with self.db.acquire() as conn:
+                    async with conn.transaction():
+                        if upserts:
+                            await conn.execute(
+                                """INSERT INTO user_progress (user_id, current_task, city)
+                                SELECT * FROM unnest($1::bigint[], $2::int[], $3::text[])
+                                ON CONFLICT (user_id) DO UPDATE
+                                SET current_task = EXCLUDED.current_task, city = EXCLUDED.city""",
+                                list(upserts.keys()),
+                                [value[0] for value in upserts.values()],
+                                [value[1] for value in upserts.values()]
+                            )
+                        if deletes:
+                            await conn.execute(
+                                "DELETE FROM user_progress WHERE user_id = ANY($1::bigint[])",
+                                deletes
+                            )
+                self.written += len(batch)
+            except Exception as e:
+                # Возвращаем изменения, не затирая более новые, пришедшие во время записи
+                for user_id, value in batch.items():
+                    self._dirty.setdefault(user_id, value)
+                logger.error(f"Ошибка записи прогресса квеста ({len(batch)} польз.): {e}")
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "written": self.written,
+        }
+
+
+progress_store = ProgressStore(
+    db=db,
+    flush_interval=PROGRESS_FLUSH_INTERVAL,
+    flush_size=PROGRESS_FLUSH_SIZE,
+    cache_size=PROGRESS_CACHE_SIZE
+)
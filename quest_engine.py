@@ -0,0 +1,180 @@
+import os
+import json
+import asyncio
+import logging
+
+from aiogram import types
+from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
+
+from callbacks import NEXT_TASK, pack
+
+logger = logging.getLogger(__name__)
+
+# Содержимое квеста лежит в JSON и перечитывается без перезапуска бота
+QUEST_FILE = os.getenv("QUEST_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quest.json"))
+# Как часто проверять, изменился ли файл (0 — только по команде /reloadquest)
+QUEST_RELOAD_INTERVAL = float(os.getenv("QUEST_RELOAD_INTERVAL", "30"))
+
+# Что шаг ждет от пользователя
+PHOTO = "photo"
+TEXT = "text"
+ANSWER = "answer"  # текст, который должен совпасть с одним из вариантов
+
+DEFAULT_INVALID = {
+    PHOTO: "❌ Пожалуйста, отправь фотографию!",
+    TEXT: "📝 Пожалуйста, ответь текстом.",
+    ANSWER: "📝 Пожалуйста, ответь текстом.",
+}
+
+
+def normalize_answer(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _reply_markup(spec) -> types.ReplyKeyboardMarkup | types.ReplyKeyboardRemove | None:
+    """"remove" убирает клавиатуру, словарь {buttons, sizes, one_time} строит новую"""
+    if spec is None:
+        return None
+    if spec == "remove":
+        return types.ReplyKeyboardRemove()
+    builder = ReplyKeyboardBuilder()
+    for text in spec["buttons"]:
+        builder.button(text=text)
+    if spec.get("sizes"):
+        builder.adjust(*spec["sizes"])
+    return builder.as_markup(resize_keyboard=True, one_time_keyboard=spec.get("one_time", False))
+
+
+class Step:
+    """Шаг задания: подсказка, ожидаемый ввод и ответ бота. Клавиатуры собраны заранее"""
+    __slots__ = (
+        'kind', 'prompt', 'reply_markup', 'buttons', 'invalid',
+        'accept', 'wrong', 'reply', 'reply_keyboard', 'save'
+    )
+
+    def __init__(self, raw: dict):
+        self.kind = raw["type"]
+        if self.kind not in DEFAULT_INVALID:
+            raise ValueError(f"неизвестный тип шага {self.kind!r}")
+        self.prompt: str | None = raw.get("prompt")
+        self.reply_markup = _reply_markup(raw.get("keyboard"))
+        # Кнопки клавиатуры шага: текст кнопки -> напоминание, что прислать
+        self.buttons: dict[str, str] = raw.get("buttons", {})
+        self.invalid: str = raw.get("invalid", DEFAULT_INVALID[self.kind])
+        self.accept = frozenset(normalize_answer(answer) for answer in raw.get("accept", ()))
+        if self.kind == ANSWER and not self.accept:
+            raise ValueError("у шага-вопроса нет вариантов ответа")
+        self.wrong: str = raw.get("wrong", "Неверно, попробуй еще раз!")
+        self.reply: str | None = raw.get("reply")
+        self.reply_keyboard = _reply_markup(raw.get("reply_keyboard"))
+        # Фото с save=false не пишется сразу, а прикладывается к ответу следующего шага
+        self.save: bool = raw.get("save", True)
+
+
+class Task:
+    __slots__ = ('number', 'title', 'steps', 'after', 'next_text', 'next_markup')
+
+    def __init__(self, number: int, raw: dict, default_next: dict):
+        self.number = number
+        self.title: str = raw.get("title", "")
+        self.steps: tuple[Step, ...] = tuple(Step(step) for step in raw["steps"])
+        if not self.steps:
+            raise ValueError("в задании нет шагов")
+        self.after: tuple[str, ...] = tuple(raw.get("after", ()))
+        # next: null — следующее задание начинается сразу, без кнопки «Далее»
+        next_spec = raw.get("next", default_next)
+        self.next_text: str | None = None
+        self.next_markup: types.InlineKeyboardMarkup | None = None
+        if next_spec is not None:
+            builder = InlineKeyboardBuilder()
+            builder.button(text=next_spec["button"], callback_data=pack(NEXT_TASK, number))
+            self.next_text = next_spec["text"]
+            self.next_markup = builder.as_markup()
+
+
+class Quest:
+    """Разобранный квест: задания по номеру и шаги по (задание, шаг) — поиск за O(1)"""
+    __slots__ = ('welcome', 'restart', 'intro', 'final', 'finish', 'points', 'tasks', 'steps')
+
+    def __init__(self, raw: dict):
+        self.welcome: str = raw["welcome"]
+        self.restart: str = raw.get("restart", self.welcome)
+        self.intro: str = raw["intro"]
+        self.final: tuple[str, ...] = tuple(raw.get("final", ()))
+        self.finish: str = raw["finish"]
+        self.points: int = raw.get("points", 0)
+
+        default_next = raw["next"]
+        self.tasks: dict[int, Task] = {}
+        self.steps: dict[tuple[int, int], Step] = {}
+        for number, raw_task in enumerate(raw["tasks"], start=1):
+            try:
+                task = Task(number, raw_task, default_next)
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"задание {number}: {e!r}") from e
+            self.tasks[number] = task
+            for index, step in enumerate(task.steps):
+                self.steps[(number, index)] = step
+        if not self.tasks:
+            raise ValueError("в квесте нет заданий")
+
+
+class QuestEngine:
+    """Держит текущую версию квеста и подменяет ее, когда меняется файл.
+
+    Обработчики берут `quest_engine.quest` один раз за апдейт, поэтому
+    перезагрузка посреди обработки не смешивает старую и новую версии.
+    Если новый файл не разбирается, остается прежняя версия.
+    """
+
+    def __init__(self, path: str, reload_interval: float):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.quest: Quest | None = None
+        self._mtime: int | None = None
+        self._task: asyncio.Task | None = None
+        self.reloads = 0
+
+    def load(self) -> Quest:
+        self._mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding="utf-8") as f:
+            try:
+                quest = Quest(json.load(f))
+            except KeyError as e:
+                raise ValueError(f"нет обязательного поля {e}") from e
+        self.quest = quest
+        self.reloads += 1
+        logger.info(f"Квест загружен из {self.path}: заданий {len(quest.tasks)}, шагов {len(quest.steps)}")
+        return quest
+
+    def reload_if_changed(self) -> bool:
+        # mtime запоминается до разбора: битый файл не перечитывается каждый цикл
+        if os.stat(self.path).st_mtime_ns == self._mtime:
+            return False
+        self.load()
+        return True
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                logger.error(f"Квест не перезагружен, остается прежняя версия: {e}")
+
+    async def start(self):
+        self.load()
+        if self.reload_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+quest_engine = QuestEngine(path=QUEST_FILE, reload_interval=QUEST_RELOAD_INTERVAL)
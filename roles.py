@@ -0,0 +1,146 @@
+import os
+import time
+import asyncio
+import logging
+
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+# Страховочный срок жизни кэша на случай потерянного уведомления
+ROLE_CACHE_TTL = float(os.getenv("ROLE_CACHE_TTL", "300"))
+# Канал, в который триггер на users шлет уведомление при смене роли
+ROLE_CHANNEL = "user_roles"
+# Пауза перед повторной подпиской после обрыва LISTEN: удваивается до максимума
+ROLE_LISTEN_RETRY_DELAY = float(os.getenv("ROLE_LISTEN_RETRY_DELAY", "1"))
+ROLE_LISTEN_MAX_DELAY = float(os.getenv("ROLE_LISTEN_MAX_DELAY", "60"))
+
+
+class RoleCache:
+    """Кэш списка админов, сбрасывается по LISTEN/NOTIFY или по TTL.
+
+    LISTEN держит собственное соединение вне пула: иначе подписка на все
+    время работы занимала бы один из слотов, нужных обработчикам.
+    """
+
+    def __init__(self, db: Database, ttl: float, retry_delay: float, max_delay: float):
+        self.db = db
+        self.ttl = ttl
+        self.retry_delay = retry_delay
+        self.max_delay = max_delay
+        self._admins: frozenset[int] | None = None
+        self._loaded_at = 0.0
+        # Растет при каждом сбросе: загрузка, начатая до сброса, не попадает в кэш
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._listener = None
+        self._reconnect_task: asyncio.Task | None = None
+
+    async def _get(self) -> frozenset[int]:
+        admins = self._admins
+        if admins is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return admins
+
+        async with self._lock:
+            # Пока ждали блокировку, кэш мог загрузить другой обработчик
+            if self._admins is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._admins
+            generation = self._generation
+            async with self.db.acquire() as conn:
+                rows = await conn.fetch("SELECT id FROM users WHERE role = 'admin'")
+            admins = frozenset(row['id'] for row in rows)
+            # NOTIFY пришел во время запроса — результат мог устареть, не кэшируем его
+            if generation == self._generation:
+                self._admins = admins
+                self._loaded_at = time.monotonic()
+            return admins
+
+    async def is_admin(self, user_id: int) -> bool:
+        return user_id in await self._get()
+
+    async def admin_ids(self) -> frozenset[int]:
+        return await self._get()
+
+    def invalidate(self):
+        self._generation += 1
+        self._admins = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        logger.info(f"Роль пользователя {payload} изменена, кэш админов сброшен")
+        self.invalidate()
+
+    def _on_terminate(self, connection):
+        # Пока подписки нет, кэш живет только до истечения TTL
+        logger.warning("Соединение LISTEN потеряно, переподписываемся")
+        self._listener = None
+        self.invalidate()
+        if self._reconnect_task is None:
+            self._reconnect_task = asyncio.create_task(self._reconnect(connection))
+
+    async def _subscribe(self):
+        listener = await self.db.connect_dedicated()
+        try:
+            listener.add_termination_listener(self._on_terminate)
+            await listener.add_listener(ROLE_CHANNEL, self._on_notify)
+        except BaseException:
+            listener.remove_termination_listener(self._on_terminate)
+            await self._close(listener)
+            raise
+        self._listener = listener
+
+    @staticmethod
+    async def _close(connection):
+        try:
+            await connection.close(timeout=5)
+        except Exception as e:
+            logger.warning(f"Не удалось закрыть соединение LISTEN: {e}")
+            connection.terminate()
+
+    async def _reconnect(self, lost=None):
+        try:
+            if lost is not None and not lost.is_closed():
+                await self._close(lost)
+
+            delay = self.retry_delay
+            while True:
+                try:
+                    await self._subscribe()
+                except Exception as e:
+                    logger.error(f"Не удалось подписаться на {ROLE_CHANNEL}, повтор через {delay:g} с: {e}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_delay)
+                    continue
+                # Уведомления, пришедшие без подписки, потеряны
+                self.invalidate()
+                logger.info(f"Подписка на {ROLE_CHANNEL} восстановлена")
+                return
+        finally:
+            self._reconnect_task = None
+
+    async def start(self):
+        try:
+            await self._subscribe()
+        except Exception as e:
+            logger.error(f"Не удалось подписаться на {ROLE_CHANNEL}: {e}")
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def stop(self):
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            try:
+                await self._reconnect_task
+            except asyncio.CancelledError:
+                pass
+        if self._listener is None:
+            return
+        listener, self._listener = self._listener, None
+        # Закрытие вызвало бы _on_terminate и новую подписку
+        listener.remove_termination_listener(self._on_terminate)
+        await self._close(listener)
+
+role_cache = RoleCache(
+    db=db,
+    ttl=ROLE_CACHE_TTL,
+    retry_delay=ROLE_LISTEN_RETRY_DELAY,
+    max_delay=ROLE_LISTEN_MAX_DELAY
+)
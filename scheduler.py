@@ -0,0 +1,112 @@
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Сколько апдейтов обрабатывать одновременно (и в webhook, и в polling)
+UPDATES_CONCURRENCY = int(os.getenv("UPDATES_CONCURRENCY", "50"))
+# При такой очереди ожидающих апдейтов новые отбрасываются
+UPDATES_MAX_BACKLOG = int(os.getenv("UPDATES_MAX_BACKLOG", "1000"))
+
+
+class _ChatQueue:
+    __slots__ = ('lock', 'size')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.size = 0
+
+
+class UpdateScheduler(BaseMiddleware):
+    """Параллельная обработка апдейтов разных чатов с сохранением порядка внутри чата.
+
+    asyncio.Lock отдает блокировку в порядке очереди, поэтому апдейты одного
+    чата выполняются строго по очереди, а разные чаты делят общий лимит воркеров.
+    """
+
+    def __init__(self, workers: int, max_backlog: int):
+        self.max_backlog = max_backlog
+        self._workers = asyncio.Semaphore(workers)
+        self._chats: dict[int, _ChatQueue] = {}
+        self.waiting = 0
+        self.running = 0
+        self.max_waiting = 0
+        self.processed = 0
+        self.shed = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any]
+    ) -> Any:
+        if self.waiting >= self.max_backlog:
+            self.shed += 1
+            if self.shed % 100 == 1:
+                logger.warning(f"Очередь апдейтов переполнена ({self.waiting}), отброшено всего: {self.shed}")
+            return None
+
+        chat = data.get("event_chat") or data.get("event_from_user")
+        chat_id = chat.id if chat else None
+        queue = None
+        if chat_id is not None:
+            queue = self._chats.get(chat_id)
+            if queue is None:
+                queue = self._chats[chat_id] = _ChatQueue()
+            queue.size += 1
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        started = False
+        try:
+            if queue is not None:
+                await queue.lock.acquire()
+            try:
+                async with self._workers:
+                    started = True
+                    self.waiting -= 1
+                    self.running += 1
+                    try:
+                        return await handler(event, data)
+                    finally:
+                        self.running -= 1
+                        self.processed += 1
+            finally:
+                if queue is not None:
+                    queue.lock.release()
+        finally:
+            if not started:
+                # Отменили, пока апдейт ждал своей очереди
+                self.waiting -= 1
+            if queue is not None:
+                queue.size -= 1
+                if not queue.size:
+                    del self._chats[chat_id]
+
+    def attach(self, dispatcher: Dispatcher):
+        """Ставит планировщик перед FSMContextMiddleware диспетчера.
+
+        Dispatcher регистрирует FSMContextMiddleware еще в __init__, а register()
+        добавляет только в конец. Снаружи очереди состояние читалось бы до того,
+        как предыдущий апдейт того же чата его изменил.
+        """
+        middlewares = dispatcher.update.outer_middleware._middlewares
+        middlewares.insert(middlewares.index(dispatcher.fsm), self)
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "max_waiting": self.max_waiting,
+            "chats": len(self._chats),
+            "processed": self.processed,
+            "shed": self.shed,
+        }
+
+
+update_scheduler = UpdateScheduler(workers=UPDATES_CONCURRENCY, max_backlog=UPDATES_MAX_BACKLOG)
@@ -0,0 +1,331 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+import asyncpg
+from aiogram import Bot
+
+from admin_digest import QuestReport, admin_digest
+from database import Database, db
+from known_users import known_users
+
+logger = logging.getLogger(__name__)
+
+# Размер очереди (при переполнении обработчики ждут), размер пакета COPY и задержка накопления
+SUBMISSION_QUEUE_SIZE = int(os.getenv("SUBMISSION_QUEUE_SIZE", "1000"))
+SUBMISSION_BATCH_SIZE = int(os.getenv("SUBMISSION_BATCH_SIZE", "100"))
+SUBMISSION_FLUSH_INTERVAL = float(os.getenv("SUBMISSION_FLUSH_INTERVAL", "0.5"))
+# Сколько пакетов обрабатывается параллельно и сколько раз повторять запись при сбое БД
+SUBMISSION_WORKERS = int(os.getenv("SUBMISSION_WORKERS", "2"))
+SUBMISSION_MAX_RETRIES = int(os.getenv("SUBMISSION_MAX_RETRIES", "3"))
+SUBMISSION_RETRY_DELAY = float(os.getenv("SUBMISSION_RETRY_DELAY", "0.5"))
+# Сколько последних file_unique_id помнить, чтобы ловить повторные фото без запроса к БД
+PHOTO_RECENT_SIZE = int(os.getenv("PHOTO_RECENT_SIZE", "50000"))
+
+SUBMISSION_COLUMNS = ('user_id', 'city', 'task_number', 'photo_id', 'answer', 'submission_time', 'photo_unique_id')
+# Индексы полей в записи ответа
+ANSWER, PHOTO_UNIQUE_ID = 4, 6
+
+# Ошибки в самих данных: повтор не поможет, такие строки сразу идут построчно и в dead letters
+DATA_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+class _Submission:
+    __slots__ = ('record', 'report', 'enqueued_at', 'duplicate')
+
+    def __init__(self, record: tuple, report: QuestReport | None, duplicate: bool):
+        self.record = record
+        self.report = report
+        self.enqueued_at = time.monotonic()
+        self.duplicate = duplicate
+
+
+class SubmissionWriter:
+    """Фоновый конвейер ответов квеста: очередь -> пул воркеров -> БД -> отчет админам.
+
+    Обработчик только ставит ответ в очередь. Воркер собирает пакет, пишет
+    его в quest_submissions через COPY с повторами при сбоях БД, а строки,
+    которые так и не записались, кладет в submission_dead_letters. Отчеты
+    админам передаются в admin_digest после записи и отправляются в фоне.
+
+    Повторные фото (тот же file_unique_id) ищутся сначала в памяти при
+    постановке в очередь, затем одним запросом по индексу на пакет. Такое
+    фото не сохраняется и не пересылается админам: остается только ответ,
+    а ответ без текста отбрасывается целиком.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        queue_size: int,
+        batch_size: int,
+        flush_interval: float,
+        workers: int,
+        max_retries: int,
+        retry_delay: float,
+        recent_size: int
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.recent_size = recent_size
+        self._recent: OrderedDict[str, None] = OrderedDict()
+        self._queue: asyncio.Queue[_Submission] = asyncio.Queue(maxsize=queue_size)
+        self._bot: Bot | None = None
+        self._tasks: list[asyncio.Task] = []
+        # Пакеты, которые пишутся сейчас, и недособранные при остановке (не теряются)
+        self._in_flight: set[asyncio.Future] = set()
+        self._leftover: list[_Submission] = []
+        self.written = 0
+        self.retried = 0
+        self.dead = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.skipped = 0
+        # Задержка в очереди: от постановки до того, как воркер взял ответ
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.dequeued = 0
+
+    async def put(
+        self,
+        user_id: int,
+        city: str,
+        task: int,
+        photo_id: str = None,
+        answer: str = None,
+        photo_unique_id: str = None,
+        report: QuestReport | None = None
+    ):
+        """Ставит ответ в очередь; ждет только если очередь переполнена"""
+        duplicate = False
+        if photo_unique_id:
+            duplicate = photo_unique_id in self._recent
+            self._recent[photo_unique_id] = None
+            self._recent.move_to_end(photo_unique_id)
+            while len(self._recent) > self.recent_size:
+                self._recent.popitem(last=False)
+        record = (user_id, city, task, photo_id, answer, datetime.now(), photo_unique_id)
+        await self._queue.put(_Submission(record, report, duplicate))
+
+    def _take(self, item: _Submission) -> _Submission:
+        lag = time.monotonic() - item.enqueued_at
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+        self.dequeued += 1
+        return item
+
+    async def _collect(self, batch: list[_Submission]):
+        """Ждет первую запись и добирает пакет, пока не истечет flush_interval"""
+        batch.append(self._take(await self._queue.get()))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._take(await asyncio.wait_for(self._queue.get(), timeout)))
+            except asyncio.TimeoutError:
+                break
+
+    def _drain(self) -> list[_Submission]:
+        batch = []
+        while not self._queue.empty() and len(batch) < self.batch_size:
+            batch.append(self._take(self._queue.get_nowait()))
+        return batch
+
+    async def _copy(self, records: list[tuple]) -> Exception | None:
+        """COPY пакета с повторами при сбоях соединения; возвращает последнюю ошибку"""
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                async with self.db.acquire() as conn:
+                    await conn.copy_records_to_table(
+                        'quest_submissions',
+                        records=records,
+                        columns=SUBMISSION_COLUMNS
+                    )
+                return None
+            except DATA_ERRORS as e:
+                return e
+            except Exception as e:
+                error = e
+                logger.warning(f"Сбой записи пакета ответов ({len(records)}), попытка {attempt + 1}: {e}")
+        return error
+
+    async def _write(self, records: list[tuple]):
+        # quest_submissions ссылается на users: новые пользователи пишутся первыми
+        await known_users.flush()
+        error = await self._copy(records)
+        if error is None:
+            self.written += len(records)
+            return
+        logger.error(f"Ошибка COPY пакета ответов ({len(records)}): {error}")
+
+        # Пакет отклонен целиком — пишем построчно, чтобы в dead letters попали только битые строки
+        dead: list[tuple] = []
+        done = 0
+        try:
+            async with self.db.acquire() as conn:
+                for record in records:
+                    try:
+                        await conn.execute(
+                            """INSERT INTO quest_submissions
+                            (user_id, city, task_number, photo_id, answer, submission_time, photo_unique_id)
+                            VALUES ($1, $2, $3, $4, $5, $6, $7)""",
+                            *record
+                        )
+                        self.written += 1
+                    except asyncpg.PostgresError as e:
+                        dead.append((*record, self.max_retries + 1, str(e)))
+                    done += 1
+        except Exception as e:
+            # Соединение потеряно и после повторов: весь остаток пакета — в dead letters
+            dead.extend((*record, self.max_retries + 1, str(e)) for record in records[done:])
+        if dead:
+            self._forget(dead)
+            await self._bury(dead)
+
+    def _forget(self, records: list[tuple]):
+        """Фото из незаписанных строк не считаются присланными: повторная отправка — не дубль"""
+        for record in records:
+            if record[PHOTO_UNIQUE_ID]:
+                self._recent.pop(record[PHOTO_UNIQUE_ID], None)
+
+    async def _bury(self, dead: list[tuple]):
+        try:
+            async with self.db.acquire() as conn:
+                await conn.copy_records_to_table(
+                    'submission_dead_letters',
+                    records=dead,
+                    columns=(*SUBMISSION_COLUMNS, 'attempts', 'error')
+                )
+            self.dead += len(dead)
+            logger.error(f"{len(dead)} ответов квеста отправлено в submission_dead_letters")
+        except Exception as e:
+            self.failed += len(dead)
+            for record in dead:
+                logger.error(f"Ответ пользователя {record[0]} потерян ({record[-1]}): {e}")
+
+    def _report(self, batch: list[_Submission]):
+        # Отправка идет в фоне admin_digest: медленные админы не задерживают следующий COPY
+        for item in batch:
+            if item.report is not None and self._bot is not None:
+                admin_digest.submit(self._bot, item.report)
+
+    async def _find_stored(self, batch: list[_Submission]):
+        """Отмечает фото, которые уже есть в quest_submissions (после рестарта память пуста)"""
+        unique_ids = [
+            item.record[PHOTO_UNIQUE_ID] for item in batch
+            if item.record[PHOTO_UNIQUE_ID] and not item.duplicate
+        ]
+        if not unique_ids:
+            return
+        try:
+            async with self.db.acquire() as conn:
+                rows = await conn.fetch(
+                    """SELECT DISTINCT photo_unique_id FROM quest_submissions
+                    WHERE photo_unique_id = ANY($1::text[])""",
+                    unique_ids
+                )
+        except Exception as e:
+            # Лучше сохранить дубль, чем потерять ответ
+            logger.warning(f"Не удалось проверить повторные фото: {e}")
+            return
+        stored = {row['photo_unique_id'] for row in rows}
+        for item in batch:
+            if item.record[PHOTO_UNIQUE_ID] in stored:
+                item.duplicate = True
+
+    def _strip_duplicate(self, item: _Submission) -> _Submission | None:
+        if not item.duplicate:
+            return item
+        self.duplicates += 1
+        if not item.record[ANSWER]:
+            self.skipped += 1
+            return None
+        user_id, city, task, _, answer, submitted_at, _ = item.record
+        item.record = (user_id, city, task, None, answer, submitted_at, None)
+        if item.report is not None:
+            item.report.photo_id = None
+            item.report.duplicate_photo = True
+        return item
+
+    async def _process(self, batch: list[_Submission]):
+        await self._find_stored(batch)
+        batch = [item for item in map(self._strip_duplicate, batch) if item is not None]
+        if not batch:
+            return
+        await self._write([item.record for item in batch])
+        self._report(batch)
+
+    def _spawn(self, batch: list[_Submission]) -> asyncio.Future:
+        future = asyncio.ensure_future(self._process(batch))
+        self._in_flight.add(future)
+        future.add_done_callback(self._in_flight.discard)
+        return future
+
+    async def _run(self):
+        while True:
+            batch: list[_Submission] = []
+            try:
+                await self._collect(batch)
+            except asyncio.CancelledError:
+                self._leftover.extend(batch)
+                raise
+            # shield: отмена при остановке не должна прерывать запись пакета
+            await asyncio.shield(self._spawn(batch))
+
+    async def start(self, bot: Bot):
+        self._bot = bot
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        # Дописываем недособранные пакеты и все, что осталось в очереди
+        batch, self._leftover = self._leftover, []
+        if batch:
+            await self._process(batch)
+        while batch := self._drain():
+            await self._process(batch)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "retried": self.retried,
+            "dead": self.dead,
+            "failed": self.failed,
+            "duplicates": self.duplicates,
+            "skipped": self.skipped,
+            "lag_avg_ms": self.lag_total / self.dequeued * 1000 if self.dequeued else 0.0,
+            "lag_max_ms": self.lag_max * 1000,
+        }
+
+
+submission_writer = SubmissionWriter(
+    db=db,
+    queue_size=SUBMISSION_QUEUE_SIZE,
+    batch_size=SUBMISSION_BATCH_SIZE,
+    flush_interval=SUBMISSION_FLUSH_INTERVAL,
+    workers=SUBMISSION_WORKERS,
+    max_retries=SUBMISSION_MAX_RETRIES,
+    retry_delay=SUBMISSION_RETRY_DELAY,
+    recent_size=PHOTO_RECENT_SIZE
+)
@@ -0,0 +1,84 @@
+import logging
+from typing import Any
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject, CallbackType
+from aiogram.fsm.state import State
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Маршрут для любого состояния (как у StateFilter("*"))
+ANY_STATE = "*"
+
+_indexes: list["TextRoutes"] = []
+
+
+def state_key(state: State | str | None) -> str | None:
+    if isinstance(state, State):
+        return state.state
+    return state
+
+
+class TextRoutes:
+    """Точные тексты кнопок, которые разбираются одним поиском в словаре.
+
+    Вместо цепочки хендлеров с F.text == "..." на роутере регистрируется один
+    хендлер: он ищет (состояние, текст), затем (любое состояние, текст).
+    Порядок среди остальных хендлеров роутера — там, где создан экземпляр.
+    """
+
+    def __init__(self, router: Router):
+        self.router = router
+        self._routes: dict[tuple[str | None, str], CallableObject] = {}
+        router.message.register(self._handle, self._match)
+        _indexes.append(self)
+
+    def __call__(self, *texts: str, state: State | str | None = ANY_STATE):
+        """Декоратор: `@menu("📰 Новости")` или `@menu("Назад", state=MapStates.SATELLITE_LIST)`"""
+        key_state = state_key(state)
+
+        def decorator(callback: CallbackType) -> CallbackType:
+            for text in texts:
+                key = (key_state, text)
+                if key in self._routes:
+                    # Как и в aiogram, срабатывает зарегистрированный первым
+                    logger.warning(
+                        f"Текст {text!r} (состояние {key_state}) уже обрабатывает "
+                        f"{self._routes[key].callback.__name__}, {callback.__name__} не будет вызван"
+                    )
+                    continue
+                self._routes[key] = CallableObject(callback)
+            return callback
+
+        return decorator
+
+    def resolve(self, raw_state: str | None, text: str) -> CallableObject | None:
+        return self._routes.get((raw_state, text)) or self._routes.get((ANY_STATE, text))
+
+    async def _match(self, message: Message, raw_state: str | None = None) -> bool | dict[str, Any]:
+        if message.text is None:
+            return False
+        handler = self.resolve(raw_state, message.text)
+        if handler is None:
+            return False
+        return {"text_handler": handler}
+
+    async def _handle(self, message: Message, text_handler: CallableObject, **kwargs: Any) -> Any:
+        return await text_handler.call(message, **kwargs)
+
+    def keys(self):
+        return self._routes.keys()
+
+
+def warn_conflicts():
+    """При старте предупреждает о текстах, которые перехватывает другой роутер"""
+    seen: dict[tuple[str | None, str], TextRoutes] = {}
+    for index in _indexes:
+        for key in index.keys():
+            owner = seen.setdefault(key, index)
+            if owner is not index:
+                logger.warning(
+                    f"Текст {key[1]!r} (состояние {key[0]}) зарегистрирован и в {owner.router.name}, "
+                    f"и в {index.router.name}: сработает тот, что раньше в цепочке роутеров"
+                )
@@ -0,0 +1,58 @@
+import os
+import asyncio
+import logging
+import secrets
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+# Режим запуска: polling (по умолчанию) или webhook
+BOT_RUN_MODE = os.getenv("BOT_RUN_MODE", "polling")
+# Публичный адрес бота, например https://quizbot-thedenfire.amvera.io
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+# containerPort из amvera.yml
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "80"))
+# Без явного секрета генерируем новый при каждом запуске — set_webhook его обновит
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher):
+    await bot.set_webhook(
+        url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dispatcher.resolve_used_update_types()
+    )
+    logger.info(f"Webhook установлен на {WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}")
+
+
+def build_app(dispatcher: Dispatcher, bot: Bot) -> web.Application:
+    app = web.Application()
+    # Telegram сразу получает 200, а очередность и лимит обработки задает update_scheduler
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot):
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для режима webhook нужен WEBHOOK_BASE_URL")
+
+    dispatcher.startup.register(set_webhook)
+    runner = web.AppRunner(build_app(dispatcher, bot))
+    await runner.setup()
+    await web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT).start()
+    logger.info(f"Webhook-сервер слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,48 @@
+import asyncio
+from abc import ABC, abstractmethod
+
+
+class WriteBehindBuffer(ABC):
+    """Основа буферов с отложенной записью в БД.
+
+    Наследник копит изменения в памяти и реализует flush(). Фоновая задача
+    вызывает его раз в flush_interval или раньше — по wake(), когда буфер
+    набрал пакет. stop() останавливает задачу и сбрасывает остаток.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @abstractmethod
+    async def flush(self):
+        """Записывает накопленное в БД"""
+
+    def wake(self):
+        """Просит записать пакет, не дожидаясь flush_interval"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # shield: отмена при остановке не должна прерывать запись пакета
+            await asyncio.shield(self.flush())
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()